@@ -1,11 +1,125 @@
 from django.db.models.loading import AppCache
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from contextlib import contextmanager
 from importlib import import_module
 from types import ModuleType
+import threading
+import time
+
+class Registry(dict):
+    """
+    every symbol resolved through apps or models, keyed by its dotted path as
+    written in config, e.g. "apps.traversal.views.Rest" or "models.auth.User".
+    shared by Models and Apps, so each symbol is resolved once per process.
+    """
+    # names the roots are known by in config expressions
+    aliases = {"all_apps": "apps", "all_models": "models"}
+
+    def lookup(self, path):
+        """
+        return the object for a dotted path. a path that was resolved before is
+        a single dict hit.
+        """
+        try:
+            return self[path]
+        except KeyError:
+            pass
+        parts = path.split('.')
+        parts[0] = self.aliases.get(parts[0], parts[0])
+        key = '.'.join(parts)
+        try:
+            return self[key]
+        except KeyError:
+            pass
+        out = self[parts[0]]
+        for part in parts[1:]:
+            out = getattr(out, part)
+        self[path] = self[key] = out
+        return out
+
+
+class ImportTracer(object):
+    """
+    records the lazy imports made by Apps and ModuleWrapper: the module imported,
+    the dotted path that triggered it, what caused it (e.g. the PathNode route and
+    config key being evaluated) and the wall time it took.
+
+    enabled by the TRAVERSAL_TRACE_IMPORTS setting, or by setting `enabled`.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        self._local = threading.local()
+
+    def import_module(self, path, trigger):
+        """
+        import the module at path, recording it if tracing is enabled. failed
+        imports are not recorded; attribute lookups try an import for every name.
+        """
+        if not self.enabled:
+            return import_module(path)
+        start = time.time()
+        module = import_module(path)
+        self.records.append({
+            "module": path,
+            "trigger": trigger,
+            "cause": self.current_cause,
+            "seconds": time.time() - start,
+        })
+        return module
+
+    @contextmanager
+    def cause(self, label):
+        """
+        attribute imports made inside the block to label
+        """
+        stack = self._local.__dict__.setdefault("causes", [])
+        stack.append(label)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def _get_current_cause(self):
+        stack = getattr(self._local, "causes", None)
+        return stack[-1] if stack else None
+    current_cause = property(_get_current_cause)
+
+    def report(self):
+        """
+        return the recorded imports, slowest first
+        """
+        return sorted(self.records, key=lambda r: r["seconds"], reverse=True)
+
+    def preload_list(self):
+        """
+        return the dotted paths that triggered imports, slowest first and without
+        duplicates, in a form that can be passed to `preload`
+        """
+        out = []
+        for record in self.report():
+            if record["trigger"] not in out:
+                out.append(record["trigger"])
+        return out
+
+    def reset(self):
+        self.records = []
+
+
+def preload(paths):
+    """
+    resolve each dotted path now, e.g. at startup, so that no request pays for
+    importing it.
+    """
+    for path in paths:
+        registry.lookup(path)
+
 
 class Models(object):
-    def __init__(self):
+    def __init__(self, registry):
         self.cache = AppCache()
+        self.registry = registry
 
     def __getattr__(self, name):
         """
@@ -13,10 +127,11 @@ class Models(object):
         """
         try:
             package = ModelPackage(self.cache.get_app(name), name, self)
-            setattr(self, name, package)
-            return package
-        except:
+        except ImproperlyConfigured:
             raise AttributeError("object 'Models' has no attribute '{}'".format(name))
+        setattr(self, name, package)
+        self.registry["models." + name] = package
+        return package
 
     def _get_models(self, pkg):
         """
@@ -30,66 +145,80 @@ class ModelPackage(object):
         self.parent = parent
         self.package = package
         self.name = name
+        self.models = None
 
     def __getattr__(self, name):
+        """
+        only called for models that have not been looked up yet; found models are
+        attached to the instance, so later lookups are plain attribute hits
+        """
+        if self.models is None:
+            self.models = {x.__name__: x for x in self.parent._get_models(self.package)}
         try:
-            if not hasattr(self, 'models'):
-                models = self.parent._get_models(self.package)
-                self.models = {x.__name__: x for x in models}
-            return self.models[name]
-        except:
+            model = self.models[name]
+        except KeyError:
             raise AttributeError("module '{}' has no attribute {}".format(self.name, name))
+        setattr(self, name, model)
+        self.parent.registry["models.{}.{}".format(self.name, name)] = model
+        return model
 
 
 class Apps(object):
-    def __init__(self):
+    def __init__(self, registry):
         self.app_paths = {x.split('.')[-1]: x for x in settings.INSTALLED_APPS}
-       
+        self.registry = registry
+
     def __getattr__(self, name):
         """
         If the package doesn't exist, then locate it, attach it and return it
         """
         try:
             packageString = self.app_paths[name]
-            package = import_module(packageString)
-            package = ModuleWrapper(package, packageString)
-            setattr(self, name, package)
-            return package
-        except:
+            package = import_tracer.import_module(packageString, "apps." + name)
+        except (KeyError, ImportError):
             raise ImportError("No app named '{}'".format(name))
+        package = ModuleWrapper(package, packageString, "apps." + name, self.registry)
+        setattr(self, name, package)
+        self.registry["apps." + name] = package
+        return package
 
 class ModuleWrapper(object):
-    def __init__(self, module, path):
-        self.module = module
-        self.path = path
-        self.modules = {}
-
-    def __getattribute__(self, val):
-        modules = super(ModuleWrapper, self).__getattribute__("modules")
-        module = super(ModuleWrapper, self).__getattribute__("module")
-        path = super(ModuleWrapper, self).__getattribute__("path")
-        if val in modules:
-            return modules[val]
+    """
+    wraps a module so that missing attributes are imported as submodules.
+
+    resolved attributes are stored on the instance and in the registry, so each
+    one is resolved once; submodules are wrapped once and the wrapper is reused.
+    """
+    def __init__(self, module, path, key, registry):
+        self.__module = module
+        self.__path = path
+        self.__key = key
+        self.__registry = registry
+
+    def __getattr__(self, val):
+        key = self.__key + '.' + val
         try:
-            out = getattr(module, val)
-            if isinstance(out, ModuleType):
-                return ModuleWrapper(out, path + '.' + val)
-            else:
-                return out
-        except AttributeError as e:
+            out = self.__registry[key]
+        except KeyError:
+            path = self.__path + '.' + val
             try:
-                moduleString = path + '.' + val
-                module = import_module(moduleString)
-                module = ModuleWrapper(module, moduleString)
-                modules[val] = module
-                return module
-            except:
-                raise e
+                out = getattr(self.__module, val)
+            except AttributeError as e:
+                try:
+                    out = import_tracer.import_module(path, key)
+                except ImportError:
+                    raise e
+            if isinstance(out, ModuleType):
+                out = ModuleWrapper(out, path, key, self.__registry)
+            self.__registry[key] = out
+        setattr(self, val, out)
+        return out
 
     def __repr__(self):
-        module = super(ModuleWrapper, self).__getattribute__("module")
-        return repr(module)
+        return repr(self.__module)
 
 
-models = Models()
-apps = Apps()
+import_tracer = ImportTracer(getattr(settings, "TRAVERSAL_TRACE_IMPORTS", False))
+registry = Registry()
+models = registry["models"] = Models(registry)
+apps = registry["apps"] = Apps(registry)
@@ -0,0 +1,175 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import logging
+import random
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+from .tracing import debug_cursors
+
+logger = logging.getLogger("traversal.budget")
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def current():
+    """
+    the Ledger being kept in this thread, or None
+    """
+    return getattr(_local, "ledger", None)
+
+
+def enforced():
+    """
+    whether query_budget is checked on every request that has one, rather than
+    only on sampled requests. TRAVERSAL_ENFORCE_QUERY_BUDGETS, default DEBUG.
+    """
+    return getattr(settings, "TRAVERSAL_ENFORCE_QUERY_BUDGETS", settings.DEBUG)
+
+
+def should_account(node, rate):
+    """
+    account for the queries of a request that resolved to node if budgets are
+    enforced and node or an ancestor declares one, or else at rate (0 to 1)
+    """
+    if enforced():
+        parent = node
+        while parent is not None:
+            if "query_budget" in parent._config:
+                return True
+            parent = parent.parent
+    return rate > 0 and random.random() < rate
+
+
+class active(object):
+    """
+    context manager that makes ledger, which may be None, the current one in this
+    thread, e.g. in a pool thread evaluating values for the request's thread. the
+    queries it logs are dropped on exit, as nothing resets a pool thread's.
+    """
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+    def __enter__(self):
+        self._previous = current()
+        _local.ledger = self.ledger
+        if self.ledger is not None:
+            self._cursors = debug_cursors(truncate=True)
+            self._cursors.__enter__()
+        return self.ledger
+
+    def __exit__(self, *exc):
+        if self.ledger is not None:
+            self._cursors.__exit__(*exc)
+        _local.ledger = self._previous
+
+
+class Ledger(object):
+    """
+    the queries, and their time, that each node's config evaluations and view
+    dispatch made during one request. a query is counted once, against the
+    innermost evaluation that made it, so parent.qs evaluated inside a child's
+    expression counts against the parent.
+
+    other threads can measure into the same ledger, see `active`.
+    """
+    def __init__(self):
+        self.nodes = {}     # route -> [node, queries, seconds]
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_stack(self):
+        """
+        the totals of this thread's evaluations nested in the ones under way
+        """
+        return self._local.__dict__.setdefault("stack", [])
+    stack = property(_get_stack)
+
+    def __enter__(self):
+        self._previous = current()
+        _local.ledger = self
+        self._cursors = debug_cursors()
+        self._cursors.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._cursors.__exit__(*exc)
+        _local.ledger = self._previous
+
+    def measure(self, node, fn):
+        """
+        call fn, counting the queries it makes against node
+        """
+        before = [(c, len(c.queries)) for c in connections.all()]
+        self.stack.append([0, 0.0])
+        try:
+            return fn()
+        finally:
+            queries = 0
+            seconds = 0.0
+            for c, start in before:
+                new = c.queries[start:]
+                queries += len(new)
+                seconds += sum(float(q["time"]) for q in new)
+            stack = self.stack
+            nested = stack.pop()
+            with self.lock:
+                entry = self.nodes.setdefault(node.route, [node, 0, 0.0])
+                entry[1] += queries - nested[0]
+                entry[2] += seconds - nested[1]
+            if stack:
+                stack[-1][0] += queries
+                stack[-1][1] += seconds
+
+    def settle(self):
+        """
+        add the request to query_stats and check each node's query_budget. when
+        budgets are enforced, a node over budget is logged, or raises
+        QueryBudgetExceeded if TRAVERSAL_QUERY_BUDGET_ACTION is "raise".
+        """
+        over = []
+        for route, (node, queries, seconds) in sorted(self.nodes.items()):
+            budget = node.query_budget if "query_budget" in node._config else None
+            exceeded = budget is not None and queries > budget
+            query_stats.record(route, queries, seconds, exceeded)
+            if exceeded:
+                over.append("{} made {} queries, over its budget of {}".format(route, queries, budget))
+        if not over or not enforced():
+            return
+        for message in over:
+            logger.warning(message)
+        if getattr(settings, "TRAVERSAL_QUERY_BUDGET_ACTION", "log") == "raise":
+            raise QueryBudgetExceeded("; ".join(over))
+
+
+class QueryStats(object):
+    """
+    per route totals over the requests that were accounted for
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, queries, seconds, exceeded):
+        with self.lock:
+            entry = self.routes.setdefault(route, {"requests": 0, "queries": 0, "seconds": 0.0, "over_budget": 0})
+            entry["requests"] += 1
+            entry["queries"] += queries
+            entry["seconds"] += seconds
+            entry["over_budget"] += int(exceeded)
+
+    def stats(self):
+        with self.lock:
+            return dict((route, dict(entry)) for route, entry in self.routes.items())
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+
+
+query_stats = QueryStats()
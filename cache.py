@@ -0,0 +1,89 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import hashlib
+import time
+
+from django.core.cache import get_cache
+
+# version keys must outlive the entries that depend on them
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+class TreeCache(object):
+    """
+    a response cache for nodes that declare `cache: <seconds>`.
+
+    entries are keyed by node, path_args, query string and Accept header, which
+    picks the renderer of negotiated responses. each entry key also includes a
+    version for every concrete path prefix of the request path, so that a write
+    at /users/1 can invalidate, in constant time:
+
+    - /users/1 and everything below it, by bumping the subtree version of /users/1
+    - /users and /, by bumping the self version of each ancestor
+
+    stale entries are never deleted; they are simply no longer addressed and
+    expire on their own.
+    """
+    def __init__(self, alias="default", prefix="traversal"):
+        self.cache = get_cache(alias)
+        self.prefix = prefix
+
+    def lookup(self, request, node, path):
+        """
+        return a tuple (response, key) for the request. response is None on a miss;
+        key is what the response should be stored under by `store`.
+        """
+        version_keys = self._version_keys(path)
+        versions = self.cache.get_many(version_keys)
+        for k in version_keys:
+            if k not in versions:
+                versions[k] = self._init_version(k)
+
+        parts = [node.route, request.META.get("QUERY_STRING", ""), request.META.get("HTTP_ACCEPT", "")]
+        parts.extend("{}={!r}".format(k, v) for k, v in sorted(node.path_args.items()))
+        parts.extend("{}".format(versions[k]) for k in version_keys)
+        digest = hashlib.md5("\n".join(parts).encode("utf-8")).hexdigest()
+        key = "{}:resp:{}".format(self.prefix, digest)
+        return self.cache.get(key), key
+
+    def store(self, key, response, timeout):
+        """
+        store response under key, rendering it first if it is a lazy response
+        """
+        if hasattr(response, "render") and not response.is_rendered:
+            response.render()
+        self.cache.set(key, response, timeout)
+
+    def invalidate(self, path):
+        """
+        invalidate all entries for the concrete path (a list of path segments),
+        its ancestors and its descendants.
+        """
+        prefixes = self._prefixes(path)
+        self._bump(self._key("tree", prefixes[-1]))
+        for prefix in prefixes[:-1]:
+            self._bump(self._key("self", prefix))
+
+    def _version_keys(self, path):
+        prefixes = self._prefixes(path)
+        keys = [self._key("tree", p) for p in prefixes]
+        keys.append(self._key("self", prefixes[-1]))
+        return keys
+
+    def _prefixes(self, path):
+        return ["/".join(path[:i + 1]) for i in range(len(path))]
+
+    def _key(self, kind, prefix):
+        return "{}:{}:{}".format(self.prefix, kind, hashlib.md5(prefix.encode("utf-8")).hexdigest())
+
+    def _init_version(self, key):
+        # start at the current time, so a version key that was evicted can never
+        # come back with a value that old entries were stored under
+        version = int(time.time() * 1000)
+        self.cache.add(key, version, VERSION_TIMEOUT)
+        return self.cache.get(key, version)
+
+    def _bump(self, key):
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self._init_version(key)
@@ -0,0 +1,75 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import calendar
+import datetime
+
+from django.http import HttpResponseNotModified
+from django.utils import six
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
+
+# methods for which a conditional request may be answered with a 304
+SAFE_METHODS = ("GET", "HEAD")
+
+
+def get_validators(node):
+    """
+    return a tuple (etag, last_modified) for node, evaluating the node's `etag`
+    and `last_modified` config values if they exist. either may be None.
+
+    etag is returned quoted, last_modified as seconds since the epoch.
+    """
+    etag = node.etag if "etag" in node._config else None
+    last_modified = node.last_modified if "last_modified" in node._config else None
+    if etag is not None:
+        etag = quote_etag(six.text_type(etag))
+    if last_modified is not None:
+        last_modified = _to_timestamp(last_modified)
+    return etag, last_modified
+
+
+def not_modified(request, etag, last_modified):
+    """
+    return True if the client's cached representation, as described by the
+    If-None-Match and If-Modified-Since headers of request, is still current.
+    If-Modified-Since is ignored when If-None-Match is sent.
+    """
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        if etag is None:
+            return False
+        etags = parse_etags(if_none_match)
+        return "*" in etags or etag in [quote_etag(e) for e in etags]
+
+    if_modified_since = request.META.get("HTTP_IF_MODIFIED_SINCE")
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and last_modified <= since
+    return False
+
+
+def not_modified_response(etag, last_modified):
+    """
+    return an empty 304 response carrying the validators
+    """
+    return set_validators(HttpResponseNotModified(), etag, last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    """
+    add ETag and Last-Modified headers to response, unless the view already set them
+    """
+    if etag is not None and not response.has_header("ETag"):
+        response["ETag"] = etag
+    if last_modified is not None and not response.has_header("Last-Modified"):
+        response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def _to_timestamp(value):
+    """
+    convert a datetime, date or number to integer seconds since the epoch
+    """
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple())
+    if isinstance(value, datetime.date):
+        return calendar.timegm(value.timetuple())
+    return int(value)
@@ -0,0 +1,120 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import ast
+import functools
+import weakref
+
+from . import budget, routers, tracing
+
+# plans already worked out, per node and tuple of keys
+_layers = weakref.WeakKeyDictionary()
+
+
+def references(expression):
+    """
+    return the set of (hops, name) config values an expression refers to, where
+    hops is how many levels above the evaluating node the value lives.
+
+    >>> sorted(references("parent.qs.get(pk=node.pk_arg)"))
+    [(0, 'pk_arg'), (1, 'qs')]
+    """
+    out = set()
+    for item in ast.walk(ast.parse(expression.strip(), mode="eval")):
+        if not isinstance(item, ast.Attribute):
+            continue
+        attrs = []
+        while isinstance(item, ast.Attribute):
+            attrs.insert(0, item.attr)
+            item = item.value
+        if not isinstance(item, ast.Name) or item.id not in ("node", "parent"):
+            continue
+        hops = 1 if item.id == "parent" else 0
+        while attrs and attrs[0] == "parent":
+            attrs.pop(0)
+            hops += 1
+        if attrs:
+            out.add((hops, attrs[0]))
+    return out
+
+
+def dependencies(node, name):
+    """
+    return the (node, name) pairs that evaluating name on node will read
+    """
+    fn = node._config.get(name)
+    expression = getattr(fn, "expression", None)
+    if expression is None:
+        return []
+    out = []
+    for hops, ref in sorted(references(expression)):
+        target = node
+        for i in range(hops):
+            target = target.parent if target is not None else None
+        if target is not None and callable(target._config.get(ref)):
+            out.append((target, ref))
+    return out
+
+
+def layers(node, names):
+    """
+    return the config values needed to produce names on node, including everything
+    they depend on, as a list of layers in topological order. the values within a
+    layer do not depend on one another.
+
+    raises ValueError on a cycle.
+    """
+    names = tuple(names)
+    plans = _layers.setdefault(node, {})
+    if names in plans:
+        return plans[names]
+
+    # collect the graph reachable from the requested values
+    edges = {}
+    stack = [(node, name) for name in names if callable(node._config.get(name))]
+    while stack:
+        item = stack.pop()
+        if item in edges:
+            continue
+        edges[item] = dependencies(*item)
+        stack.extend(edges[item])
+
+    # peel off the values whose dependencies are all done
+    out = []
+    done = set()
+    while len(done) < len(edges):
+        layer = [item for item, deps in edges.items()
+                 if item not in done and all(dep in done for dep in deps)]
+        if not layer:
+            raise ValueError("config values depend on each other in a cycle on {}".format(node.route))
+        layer.sort(key=lambda item: (item[0].route, item[1]))
+        out.append(layer)
+        done.update(layer)
+
+    plans[names] = out
+    return out
+
+
+def prefetch(node, names, pool=None):
+    """
+    evaluate the config values needed for names on node, in dependency order. with
+    a multiprocessing.pool.ThreadPool, values in the same layer are evaluated
+    concurrently; each thread uses its own database connection, and takes on this
+    thread's read database, query ledger and trace.
+    """
+    context = (routers.current(), budget.current(), tracing.current())
+    for layer in layers(node, names):
+        if pool is not None and len(layer) > 1:
+            pool.map(functools.partial(_evaluate_in, context), layer)
+        else:
+            for item in layer:
+                _evaluate(item)
+
+
+def _evaluate(item):
+    node, name = item
+    return getattr(node, name)
+
+
+def _evaluate_in(context, item):
+    alias, ledger, trace = context
+    with routers.reading(alias), budget.active(ledger), tracing.active(trace):
+        return _evaluate(item)
@@ -0,0 +1,116 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import namedtuple
+import re
+
+Issue = namedtuple("Issue", ["severity", "code", "route", "message"])
+
+# severities, least severe first
+SEVERITIES = ["info", "warning", "error"]
+
+# a group containing a quantifier that is itself quantified, e.g. (a+)+ or (\w*)*
+nestedQuantifierRe = re.compile(r'\((?:[^()\\]|\\.)*[+*}](?:[^()\\]|\\.)*\)(?:[+*]|\{\d*,\d*\})')
+# querysets that are read whole unless sliced
+unboundedQsRe = re.compile(r'\.(?:all|filter|exclude|order_by)\(')
+# a trailing slice, e.g. [:100]
+sliceRe = re.compile(r'\[[^\]]*:[^\]]*\]\s*$')
+# builtins that evaluate a queryset in the expression itself
+forcingRe = re.compile(r'\b(?:list|len|sorted|tuple|set)\(')
+
+
+def lint_tree(tree):
+    """
+    statically check a PathTree for routing and query hazards. return a list of
+    Issues, most severe first.
+    """
+    issues = []
+    for node in tree.root.iter_nodes():
+        issues.extend(check_regex(node))
+        issues.extend(check_siblings(node))
+        issues.extend(check_tail(node))
+        issues.extend(check_dead_end(node))
+        issues.extend(check_expressions(node))
+    return sorted(issues, key=lambda i: -SEVERITIES.index(i.severity))
+
+
+def check_regex(node):
+    if node.kind != "regex":
+        return
+    pattern = node.regex.pattern
+    if nestedQuantifierRe.search(pattern):
+        yield Issue("error", "regex-backtracking", node.route,
+                    "nested quantifier in {!r} can backtrack catastrophically".format(pattern))
+    if not pattern.endswith("$"):
+        yield Issue("warning", "regex-unanchored", node.route,
+                    "{!r} is not anchored with $, so it matches any segment that starts with a match".format(pattern))
+
+
+def check_siblings(node):
+    """
+    children are tried in order and the first match wins, so a child can be
+    shadowed by any sibling before it.
+    """
+    seen = []
+    for child in node.children:
+        for earlier in seen:
+            if shadows(earlier, child):
+                yield Issue("error", "shadowed", child.route,
+                            "unreachable: every segment it matches is matched first by {}".format(earlier.route))
+                break
+        seen.append(child)
+
+
+def shadows(earlier, later):
+    if earlier.kind in ("splat", "tail"):
+        return True
+    if earlier.kind == "int":
+        return later.kind == "int" or (later.kind == "literal" and is_int(later.path))
+    if earlier.kind == "literal":
+        return later.kind == "literal" and later.path == earlier.path
+    if earlier.kind == "regex" and later.kind == "literal":
+        return earlier.match(later.path) is not None
+    return False
+
+
+def check_tail(node):
+    """
+    a tail node matches the rest of the path, so nothing below it can match
+    """
+    if node.kind != "tail":
+        return
+    for child in node.children:
+        yield Issue("error", "shadowed", child.route,
+                    "unreachable: {} matches the rest of the path".format(node.route))
+
+
+def is_int(value):
+    try:
+        int(value)
+    except ValueError:
+        return False
+    return True
+
+
+def check_dead_end(node):
+    if not node.views and not node.children:
+        yield Issue("warning", "dead-end", node.route, "has no views and no children; every request ends in 404")
+
+
+def check_expressions(node):
+    for name, item in sorted(node._config.items()):
+        expression = getattr(item, "expression", None)
+        if expression is None:
+            continue
+        if forcingRe.search(expression) and unboundedQsRe.search(expression):
+            yield Issue("error", "evaluated-queryset", node.route,
+                        "{} evaluates a whole queryset on every request: {}".format(name, expression))
+        elif name == "qs" and unboundedQsRe.search(expression) and not sliceRe.search(expression):
+            yield Issue("warning", "unbounded-queryset", node.route,
+                        "qs is not sliced, so list views read every row: {}".format(expression))
+
+
+def at_least(issues, severity):
+    """
+    return the issues that are at least as severe as severity
+    """
+    level = SEVERITIES.index(severity)
+    return [i for i in issues if SEVERITIES.index(i.severity) >= level]
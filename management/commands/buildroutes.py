@@ -0,0 +1,19 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import yaml as YAML
+from django.core.management.base import BaseCommand, CommandError
+
+from traversal.routetable import build
+
+
+class Command(BaseCommand):
+    args = "<yaml file> <table file>"
+    help = "Write a traversal yaml file as a route table that worker processes can share."
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError("Enter a yaml file and the route table file to write.")
+
+        with open(args[0], 'r') as f:
+            build(YAML.load(f.read()), args[1])
+        self.stdout.write("wrote {}".format(args[1]))
@@ -0,0 +1,33 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from traversal.lint import lint_tree, at_least, SEVERITIES
+from traversal.traversal import PathTree
+
+
+class Command(BaseCommand):
+    args = "<yaml file> [<yaml file> ...]"
+    option_list = BaseCommand.option_list + (
+        make_option('--fail-level', action='store', dest='fail_level', default='error',
+            choices=SEVERITIES,
+            help='Exit non-zero if any issue is at least this severe: info, warning or error. '
+                'Defaults to error.'),
+    )
+    help = "Report routing and query hazards in traversal yaml files."
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError("Enter at least one yaml file.")
+
+        failing = 0
+        for path in args:
+            issues = lint_tree(PathTree(path=path))
+            for issue in issues:
+                self.stdout.write("{}: {}: {}: {} [{}]".format(
+                    path, issue.severity, issue.route, issue.message, issue.code))
+            failing += len(at_least(issues, options['fail_level']))
+
+        if failing:
+            raise CommandError("{} issue(s) at or above {}.".format(failing, options['fail_level']))
@@ -0,0 +1,99 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import hashlib
+
+from django.core.cache import get_cache
+from django.db.models import Model
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+
+class ModelCache(object):
+    """
+    caches the objects produced by `model` expressions, for nodes that declare
+    `cache_model: <seconds>`.
+
+    two kinds of entries are kept: an index from node route and path_args to the
+    object's model and primary key, and the object itself under its model and
+    primary key. saving or deleting an object, or changing its many to many
+    relations, deletes the object entry through signals, so the next lookup misses
+    the index and runs the expression again. changes that send no signals, such as
+    QuerySet.update, are not seen unless the code making them calls `invalidate`,
+    as Rest's bulk PATCH does while `watching`.
+    """
+    def __init__(self, alias="default", prefix="traversal:obj"):
+        self.alias = alias
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.watching = False
+        self._cache = None
+
+    def _get_cache(self):
+        if self._cache is None:
+            self._cache = get_cache(self.alias)
+        return self._cache
+    cache = property(_get_cache)
+
+    def watch(self):
+        """
+        start invalidating on model signals. called by every node that declares
+        cache_model, so each process that may read the cache also invalidates it.
+        """
+        post_save.connect(self._invalidate_instance, dispatch_uid="traversal.modelcache.save")
+        post_delete.connect(self._invalidate_instance, dispatch_uid="traversal.modelcache.delete")
+        m2m_changed.connect(self._invalidate_m2m, dispatch_uid="traversal.modelcache.m2m")
+        self.watching = True
+
+    def fetch(self, node, name, call, timeout):
+        """
+        return the cached object for name on node, or call to produce it and cache
+        the result if it is a saved model instance
+        """
+        index_key = self._index_key(node, name)
+        ref = self.cache.get(index_key)
+        if ref is not None:
+            obj = self.cache.get(self._object_key(*ref))
+            if obj is not None:
+                self.hits += 1
+                return obj
+
+        self.misses += 1
+        obj = call()
+        if isinstance(obj, Model) and obj.pk is not None:
+            label = self._label(type(obj))
+            self.cache.set_many({index_key: (label, obj.pk), self._object_key(label, obj.pk): obj}, timeout)
+        return obj
+
+    def invalidate(self, model, pk):
+        self.invalidations += 1
+        self.cache.delete(self._object_key(self._label(model), pk))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _invalidate_instance(self, sender, instance, **kwargs):
+        self.invalidate(sender, instance.pk)
+
+    def _invalidate_m2m(self, sender, instance, model, pk_set, **kwargs):
+        self.invalidate(type(instance), instance.pk)
+        for pk in pk_set or ():
+            self.invalidate(model, pk)
+
+    def _label(self, model):
+        return "{}.{}".format(model._meta.app_label, model._meta.object_name.lower())
+
+    def _index_key(self, node, name):
+        parts = [node.route, name] + ["{}={!r}".format(k, v) for k, v in sorted(node.path_args.items())]
+        return "{}:idx:{}".format(self.prefix, hashlib.md5("\n".join(parts).encode("utf-8")).hexdigest())
+
+    def _object_key(self, label, pk):
+        return "{}:{}:{}".format(self.prefix, label, pk)
+
+
+model_cache = ModelCache()
@@ -0,0 +1,110 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import OrderedDict, defaultdict
+import threading
+
+
+class RejectionFilter(object):
+    """
+    rejects requests that cannot resolve before traversal begins:
+
+    - paths with more segments than the tree is deep
+    - paths with a segment that matches no node at its depth, checked at every
+      depth whose nodes are all literals
+    - method and path pairs that recently failed to traverse, kept in a bounded
+      least recently used cache of `size` entries
+
+    the first two checks do not look past the shallowest tail node (e.g.
+    <rest|*>), which matches any number of segments.
+
+    the depth index counts nodes, so subtrees can be added and removed without
+    rebuilding it. `counters` records how many requests each check rejected.
+    """
+    def __init__(self, root, size=1024):
+        self.literals = []      # per depth, a count of the literal nodes by path
+        self.wildcards = []     # per depth, a count of the nodes that are not literals
+        self.tails = []         # per depth, a count of the tail nodes
+        self.size = size
+        self.misses = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"checked": 0, "rejected_depth": 0, "rejected_segment": 0, "rejected_cached": 0}
+        self.add(root, 0)
+
+    def add(self, node, depth):
+        """
+        index node, which sits at depth, and all its descendants
+        """
+        self._index(node, depth, 1)
+
+    def remove(self, node, depth):
+        """
+        remove node, which sits at depth, and all its descendants from the index
+        """
+        self._index(node, depth, -1)
+        while self.literals and not self.wildcards[-1] and not any(self.literals[-1].values()):
+            self.literals.pop()
+            self.wildcards.pop()
+            self.tails.pop()
+
+    def _index(self, node, depth, step):
+        stack = [(node, depth)]
+        while stack:
+            node, depth = stack.pop()
+            while len(self.literals) <= depth:
+                self.literals.append(defaultdict(int))
+                self.wildcards.append(0)
+                self.tails.append(0)
+            if node.kind == "literal":
+                self.literals[depth][node.path] += step
+            else:
+                self.wildcards[depth] += step
+            if node.kind == "tail":
+                self.tails[depth] += step
+            stack.extend((child, depth + 1) for child in node.children)
+
+    def reject(self, method, path):
+        """
+        return True if the request for the list of path segments cannot resolve
+        """
+        counters = self.counters
+        counters["checked"] += 1
+        depths = len(self.literals)
+        for depth, tails in enumerate(self.tails):
+            if tails:
+                depths = depth
+                break
+        else:
+            if len(path) > depths:
+                counters["rejected_depth"] += 1
+                return True
+        for depth in range(min(len(path), depths)):
+            segment = path[depth]
+            if not self.wildcards[depth] and not self.literals[depth].get(segment):
+                counters["rejected_segment"] += 1
+                return True
+        key = (method, "/".join(path))
+        if self.size and key in self.misses:
+            with self.lock:
+                self.misses[key] = self.misses.pop(key, True)    # most recently used last
+            counters["rejected_cached"] += 1
+            return True
+        return False
+
+    def miss(self, method, path):
+        """
+        remember that the request for the list of path segments did not resolve
+        """
+        if not self.size:
+            return
+        with self.lock:
+            self.misses[(method, "/".join(path))] = True
+            while len(self.misses) > self.size:
+                self.misses.popitem(last=False)
+
+    def forget(self, prefix):
+        """
+        drop the remembered misses for paths under the list of segments prefix
+        """
+        prefix = "/".join(prefix)
+        with self.lock:
+            for key in [k for k in self.misses if k[1] == prefix or k[1].startswith(prefix + "/")]:
+                del self.misses[key]
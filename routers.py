@@ -0,0 +1,129 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.query import QuerySet
+
+from .conditional import SAFE_METHODS
+
+_local = threading.local()
+
+
+def current():
+    """
+    the database alias reads go to in this thread, or None for the router's default
+    """
+    return getattr(_local, "alias", None)
+
+
+class reading(object):
+    """
+    context manager that sends the reads in this thread to alias, if it is not None
+    """
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __enter__(self):
+        self.previous = current()
+        _local.alias = self.alias
+        return self.alias
+
+    def __exit__(self, *exc):
+        _local.alias = self.previous
+
+
+def replicas():
+    """
+    the database aliases GET and HEAD requests read from when no node says otherwise
+    """
+    return getattr(settings, "TRAVERSAL_READ_DATABASES", ())
+
+
+def node_database(node):
+    """
+    the `read_db` of node or its nearest ancestor that declares one, or None
+    """
+    while node is not None:
+        if "read_db" in node._config:
+            return node.read_db
+        node = node.parent
+    return None
+
+
+def read_database(request, node):
+    """
+    the database alias the request, which resolved to node, should read from. writes,
+    and reads within TRAVERSAL_STICKY_SECONDS of a write by the same client, read
+    from the primary, so they never see a replica that has not caught up.
+    """
+    if request.method not in SAFE_METHODS or is_sticky(request):
+        return None
+    alias = node_database(node)
+    if alias is None and replicas():
+        alias = random.choice(replicas())
+    return alias
+
+
+def is_sticky(request):
+    if getattr(request, "traversal_primary", False):
+        return True
+    until = request.COOKIES.get(sticky_cookie())
+    try:
+        return until is not None and float(until) > time.time()
+    except ValueError:
+        return False
+
+
+def stick(response):
+    """
+    keep the client on the primary for TRAVERSAL_STICKY_SECONDS (default 5) after
+    a write, with a cookie that holds the time the period ends
+    """
+    seconds = getattr(settings, "TRAVERSAL_STICKY_SECONDS", 5)
+    if seconds:
+        response.set_cookie(sticky_cookie(), "{:.3f}".format(time.time() + seconds), max_age=seconds)
+
+
+def sticky_cookie():
+    return getattr(settings, "TRAVERSAL_STICKY_COOKIE", "traversal_primary")
+
+
+def route(node, call):
+    """
+    call a config function of node, and send a queryset it returns to the node's
+    own read database, or the request's
+    """
+    value = call()
+    if current() is None or not isinstance(value, QuerySet):
+        return value
+    return value.using(node_database(node) or current())
+
+
+class ReplicaRouter(object):
+    """
+    a database router that sends reads to the alias chosen for the current request
+    by PathTree, and writes to the primary. it assumes every database other than
+    the default is a replica of it.
+
+    the querysets nodes produce are routed without it; the router also routes the
+    queries views make themselves. django before 1.6 imports routers while
+    django.db loads, before this package can be imported, so it needs 1.6 or later:
+
+        DATABASE_ROUTERS = ["traversal.routers.ReplicaRouter"]
+        TRAVERSAL_READ_DATABASES = ["replica"]
+    """
+    def db_for_read(self, model, **hints):
+        return current()
+
+    def db_for_write(self, model, **hints):
+        # an object read from a replica is saved to the primary, not back where it came from
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db not in (None, DEFAULT_DB_ALIAS):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
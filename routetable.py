@@ -0,0 +1,222 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import namedtuple
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+
+from django.http import Http404
+
+from . import tracing
+from .traversal import PathNode, splatRe, _tail
+
+# file layout, all little endian:
+#   header
+#   one NODE record per node, breadth first, so each node's children are contiguous
+#   the method names each node has a view for, as string ids
+#   string offsets (string_count + 1 of them), then the utf-8 string data
+HEADER = struct.Struct(str("<4sHHIIII"))     # magic, version, unused, node_count, method_count, string_count, meta
+NODE = struct.Struct(str("<B3xIIIIIII"))     # kind, parent, path, first_child, child_count, methods, method_count, config
+OFFSET = struct.Struct(str("<I"))
+MAGIC = b"TRVT"
+VERSION = 1
+NO_PARENT = 0xFFFFFFFF
+
+KINDS = ["literal", "splat", "int", "tail", "regex"]
+
+# the shape of the table, as RejectionFilter indexes it
+Record = namedtuple("Record", ["kind", "path", "children"])
+
+
+def kind_of(conf):
+    """
+    the kind a PathNode built from the node conf would have
+    """
+    match = splatRe.match(conf.get("path", ""))
+    if match:
+        return {"d": "int", "*": "tail"}.get(match.group(2), "splat")
+    return "regex" if conf.get("regex") else "literal"
+
+
+def build(conf, filename):
+    """
+    write the tree described by conf, a dict as loaded from the yaml, to filename
+    as a route table. the file is written beside filename and renamed over it, so
+    processes that have the old table open keep reading it.
+    """
+    order = [conf]
+    parents = [NO_PARENT]
+    first_child = []
+    i = 0
+    while i < len(order):
+        first_child.append(len(order))
+        for child in order[i].get("children") or []:
+            order.append(child)
+            parents.append(i)
+        i += 1
+
+    strings = {}
+    def string(value):
+        return strings.setdefault(value, len(strings))
+
+    nodes = []
+    methods = []
+    keys = set()
+    for i, node_conf in enumerate(order):
+        config = dict((k, v) for k, v in node_conf.items() if k != "children")
+        names = [m.strip() for k in config if k.upper() == k for m in k.split(",")]
+        keys.update(k for k in config if k.upper() != k)
+        nodes.append(NODE.pack(
+            KINDS.index(kind_of(node_conf)), parents[i], string(node_conf.get("path", "")),
+            first_child[i], len(node_conf.get("children") or []),
+            len(methods), len(names), string(json.dumps(config, sort_keys=True))))
+        methods.extend(string(m) for m in sorted(names))
+    meta = string(json.dumps({"keys": sorted(keys)}))
+
+    data = [s.encode("utf-8") for s, _ in sorted(strings.items(), key=lambda item: item[1])]
+    offsets = [0]
+    for item in data:
+        offsets.append(offsets[-1] + len(item))
+
+    tmp = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(nodes), len(methods), len(data), meta))
+        f.write(b"".join(nodes))
+        f.write(b"".join(OFFSET.pack(m) for m in methods))
+        f.write(b"".join(OFFSET.pack(o) for o in offsets))
+        f.write(b"".join(data))
+    os.rename(tmp, filename)
+
+
+class RouteTable(object):
+    """
+    a route table written by `build`, memory mapped read only, so that every worker
+    process shares one copy of the routing structure.
+
+    matching reads the table directly. a PathNode is made only for each node on a
+    path that resolves, when it is first resolved, and is kept for this process.
+    such nodes know their parent but not their children.
+
+        pathtree = PathTree(table=RouteTable("routes.table"))
+    """
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.node_count, method_count, string_count, meta = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} route table".format(filename, VERSION))
+        self.nodes_at = HEADER.size
+        self.methods_at = self.nodes_at + self.node_count * NODE.size
+        self.offsets_at = self.methods_at + method_count * OFFSET.size
+        self.strings_at = self.offsets_at + (string_count + 1) * OFFSET.size
+        self.keys = set(json.loads(self.string(meta))["keys"])
+        self._regexes = {}
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    def record(self, index):
+        """
+        the (kind, parent, path, first_child, child_count, methods, method_count,
+        config) of a node, with kind as an index into KINDS and strings as ids
+        """
+        return NODE.unpack_from(self.map, self.nodes_at + index * NODE.size)
+
+    def string_bytes(self, string_id):
+        start, = OFFSET.unpack_from(self.map, self.offsets_at + string_id * OFFSET.size)
+        end, = OFFSET.unpack_from(self.map, self.offsets_at + (string_id + 1) * OFFSET.size)
+        return self.map[self.strings_at + start:self.strings_at + end]
+
+    def string(self, string_id):
+        return self.string_bytes(string_id).decode("utf-8")
+
+    def node(self, index):
+        """
+        the PathNode for the node at index, made on first use
+        """
+        node = self._nodes.get(index)
+        if node is not None:
+            return node
+        kind, parent, path, first, count, methods, method_count, config = self.record(index)
+        parent = self.node(parent) if parent != NO_PARENT else None
+        with self._lock:
+            if index not in self._nodes:
+                node = PathNode.__new__(PathNode)
+                node._setup(parent=parent, **json.loads(self.string(config)))
+                node.children = []
+                node.child_dict = {}
+                self._nodes[index] = node
+            return self._nodes[index]
+
+    def outline(self):
+        """
+        the whole tree as Records, e.g. to build a RejectionFilter
+        """
+        records = [Record(KINDS[r[0]], self.string(r[2]), []) for r in map(self.record, range(self.node_count))]
+        for index, record in enumerate(records):
+            first, count = self.record(index)[3:5]
+            record.children.extend(records[first:first + count])
+        return records[0]
+
+    def traverse(self, request, path_remainder, path_args, *args, **kwargs):
+        """
+        resolve the split path against the table, like PathNode.traverse, and return
+        (view, path_args, node), or None if the root doesn't match the first part
+        """
+        chain = []
+        candidates = range(1)
+        offset = 0
+        for i in range(len(path_remainder)):
+            segment = path_remainder[i]
+            encoded = segment.encode("utf-8")
+            for index in candidates:
+                record = self.record(index)
+                part = _tail(request, path_remainder, i, offset) if KINDS[record[0]] == "tail" else segment
+                if self._match(index, record, part, encoded):
+                    chain.append((index, part))
+                    break
+            else:
+                if i == 0:
+                    return None
+                raise Http404
+            if KINDS[record[0]] == "tail":
+                break
+            offset += len(segment) + 1
+            candidates = range(record[3], record[3] + record[4])
+
+        if not chain or not self._has_method(record, request.method):
+            raise Http404
+
+        # only now make nodes, for the resolved path, and enter them as PathNode.traverse would
+        batch = getattr(request, "traversal_batch", None)
+        trace = tracing.current()
+        for index, part in chain:
+            node = self.node(index)
+            node._enter(part, path_args, batch, trace)
+        return (node.views[request.method], path_args, node)
+
+    def _match(self, index, record, part, encoded):
+        kind = KINDS[record[0]]
+        if kind == "literal":
+            return self.string_bytes(record[2]) == encoded
+        if kind == "int":
+            try:
+                int(part)
+            except ValueError:
+                return False
+            return True
+        if kind == "regex":
+            regex = self._regexes.get(index)
+            if regex is None:
+                regex = self._regexes[index] = re.compile(self.string(record[2]))
+            return regex.match(part) is not None
+        return True
+
+    def _has_method(self, record, method):
+        method = method.encode("utf-8")
+        for i in range(record[5], record[5] + record[6]):
+            string_id, = OFFSET.unpack_from(self.map, self.methods_at + i * OFFSET.size)
+            if self.string_bytes(string_id) == method:
+                return True
+        return False
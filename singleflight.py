@@ -0,0 +1,84 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import sys
+import threading
+
+from django.utils import six
+
+
+class Flight(object):
+    """
+    one evaluation in progress, and its outcome once it is done
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """
+    coalesces concurrent evaluations of the same config value, for nodes that
+    declare `single_flight: true` (every config function) or a list of names.
+
+    the first thread to ask for a key runs the evaluation; threads asking for the
+    same key while it runs wait for it and share its value, or its exception.
+    nothing is kept once the evaluation finishes. `coalesced` counts the waits.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.evaluations = 0
+        self.coalesced = 0
+
+    def do(self, key, call):
+        """
+        return the result of call, or of the call already running for key
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                self.evaluations += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            if flight.exc_info is not None:
+                six.reraise(*flight.exc_info)
+            return flight.value
+
+        try:
+            flight.value = call()
+        except Exception:
+            flight.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.value
+
+    def enabled(self, node, name):
+        """
+        True if node declares single_flight for name
+        """
+        if "single_flight" not in node._config:
+            return False
+        names = node._config["single_flight"]
+        return names is True or (isinstance(names, (list, tuple)) and name in names)
+
+    def key(self, node, name, path_args):
+        """
+        the key of name on node evaluated with path_args, which the caller reads once
+        for both the key and the evaluation
+        """
+        return (node._state, name, frozenset(path_args.items()) if path_args else None)
+
+    def stats(self):
+        return {"evaluations": self.evaluations, "coalesced": self.coalesced, "in_flight": len(self.flights)}
+
+
+single_flight = SingleFlight()
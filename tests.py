@@ -1,7 +1,31 @@
+import json
+import sys
+import tempfile
+import threading
+import time
 from django.test import TestCase
-from .traversal import PathNode, PathTree, PathArgContainer, all_apps, all_models
-from django.http import HttpRequest as Request, HttpResponse
+from .traversal import PathNode, PathTree, PathArgContainer, ViewResolver, all_apps, all_models
+from django.http import HttpRequest as Request, HttpResponse, Http404
+from django.test.client import RequestFactory
+from django.utils.http import http_date
+from django.core.cache import get_cache
+from django.db import connections
 from django.contrib.auth.models import User, Group
+from . import appring
+from .appring import registry
+from .lint import lint_tree
+from . import dependencies
+from .modelcache import ModelCache, model_cache
+from .singleflight import single_flight
+from .routetable import RouteTable, build
+from multiprocessing.pool import ThreadPool
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import six
+from django.test.utils import override_settings
+from . import routers
+from . import budget
+from .budget import QueryBudgetExceeded, query_stats
 
 def testViewOne(request, node=None, *args, **kwargs):
     return HttpResponse("success")
@@ -9,7 +33,48 @@ def testViewOne(request, node=None, *args, **kwargs):
 def testViewTwo(request, node=None, *args, **kwargs):
     return node, args, kwargs
 
+def testViewModel(request, node=None, *args, **kwargs):
+    return HttpResponse(node.model.username)
+
+def testViewUsernames(request, node=None, *args, **kwargs):
+    return HttpResponse(",".join(u.username for u in node.qs))
+
+def testViewGroupsPerUser(request, node=None, *args, **kwargs):
+    return HttpResponse(str(sum(len(u.groups.all()) for u in node.qs)))
+
+view_calls = []
+
+def testViewCount(request, node=None, *args, **kwargs):
+    view_calls.append(request.path)
+    return HttpResponse(str(len(view_calls)))
+
+def useConnection(connection):
+    connections["default"] = connection
+
+def sharedPool(test, workers=2):
+    """
+    a ThreadPool whose threads use this thread's connection, and so the test database
+    """
+    connection = connections["default"]
+    connection.allow_thread_sharing = True
+    test.addCleanup(setattr, connection, "allow_thread_sharing", False)
+    pool = ThreadPool(workers, initializer=useConnection, initargs=(connection,))
+    test.addCleanup(pool.close)
+    return pool
+
+slow_calls = []
+slow_release = threading.Event()
+
+def slowValue():
+    slow_calls.append(1)
+    slow_release.wait(5)
+    return len(slow_calls)
+
 class TestPathTree(TestCase):
+    def setUp(self):
+        get_cache("default").clear()
+        del view_calls[:]
+
 # creation
     def test_create_with_yaml(self):
         yaml = """
@@ -97,6 +162,369 @@ children:
         self.assertIsInstance(actual[1], PathArgContainer)
         self.assertIsInstance(actual[2], PathNode)
 
+# conditional get
+    conditional_yaml = """
+path: ""
+children:
+  - path: users
+    etag: ">>> 'v' + str(len(path_args))"
+    last_modified: ">>> 1000000000"
+    GET: all_apps.traversal.tests.testViewOne
+"""
+
+    def test_traverse_with_matching_if_none_match_expect_304_without_calling_view(self):
+        request = RequestFactory().get("/users", HTTP_IF_NONE_MATCH='"v0"')
+
+        cut = PathTree(yaml=self.conditional_yaml)
+
+        actual = cut.traverse(request)
+
+        self.assertEqual(actual.status_code, 304)
+        self.assertEqual(actual["ETag"], '"v0"')
+
+    def test_traverse_with_stale_if_none_match_expect_view_response_with_validators(self):
+        request = RequestFactory().get("/users", HTTP_IF_NONE_MATCH='"v1"')
+
+        cut = PathTree(yaml=self.conditional_yaml)
+
+        actual = cut.traverse(request)
+
+        self.assertEqual(actual.content, b"success")
+        self.assertEqual(actual["ETag"], '"v0"')
+        self.assertEqual(actual["Last-Modified"], http_date(1000000000))
+
+    def test_traverse_with_current_if_modified_since_expect_304(self):
+        request = RequestFactory().get("/users", HTTP_IF_MODIFIED_SINCE=http_date(1000000001))
+
+        cut = PathTree(yaml=self.conditional_yaml)
+
+        actual = cut.traverse(request)
+
+        self.assertEqual(actual.status_code, 304)
+
+# response cache
+    cache_yaml = """
+path: ""
+children:
+  - path: users
+    cache: 60
+    GET: all_apps.traversal.tests.testViewCount
+    children:
+      - path: <user|d>
+        cache: 60
+        GET, POST: all_apps.traversal.tests.testViewCount
+        children:
+          - path: groups
+            cache: 60
+            GET: all_apps.traversal.tests.testViewCount
+"""
+
+    def test_traverse_cached_node_twice_expect_view_called_once(self):
+        cut = PathTree(yaml=self.cache_yaml)
+
+        first = cut.traverse(RequestFactory().get("/users"))
+        actual = cut.traverse(RequestFactory().get("/users"))
+
+        self.assertEqual(actual.content, first.content)
+        self.assertEqual(view_calls, ["/users"])
+
+    def test_traverse_cached_node_with_different_query_string_expect_separate_entries(self):
+        cut = PathTree(yaml=self.cache_yaml)
+
+        cut.traverse(RequestFactory().get("/users", {"page": 1}))
+        cut.traverse(RequestFactory().get("/users", {"page": 2}))
+
+        self.assertEqual(len(view_calls), 2)
+
+    def test_traverse_cached_node_with_different_accept_expect_separate_entries(self):
+        cut = PathTree(yaml=self.cache_yaml)
+
+        cut.traverse(RequestFactory().get("/users", HTTP_ACCEPT="application/json"))
+        cut.traverse(RequestFactory().get("/users", HTTP_ACCEPT="text/html"))
+        cut.traverse(RequestFactory().get("/users", HTTP_ACCEPT="application/json"))
+
+        self.assertEqual(len(view_calls), 2)
+
+    def test_traverse_write_expect_ancestors_and_descendants_invalidated_but_not_siblings(self):
+        cut = PathTree(yaml=self.cache_yaml)
+        for path in ["/users", "/users/1/groups", "/users/2"]:
+            cut.traverse(RequestFactory().get(path))
+
+        cut.traverse(RequestFactory().post("/users/1"))
+        del view_calls[:]
+        for path in ["/users", "/users/1/groups", "/users/2"]:
+            cut.traverse(RequestFactory().get(path))
+
+        self.assertEqual(view_calls, ["/users", "/users/1/groups"])
+
+# trace
+    trace_yaml = """
+path: ""
+children:
+  - path: groups
+  - path: users
+    qs: ">>> all_models.auth.User.objects.all()"
+    children:
+      - path: <user|d>
+        model: ">>> parent.qs.get(pk=path_args['user'])"
+        GET: all_apps.traversal.tests.testViewModel
+"""
+
+    def test_traverse_traced_expect_matches_configs_and_view_recorded_on_request(self):
+        user = User.objects.create(username="traced")
+        request = RequestFactory().get("/users/{}".format(user.id))
+        cut = PathTree(yaml=self.trace_yaml, trace_rate=1)
+
+        cut.traverse(request)
+        actual = request.traversal_trace.events
+
+        self.assertEqual([(e["route"], e["matched"]) for e in actual if e["event"] == "match"],
+                         [("/", True), ("/groups", False), ("/users", True), ("/users/<user|d>", True)])
+        configs = [(e["route"], e["key"], e["queries"]) for e in actual if e["event"] == "config"]
+        self.assertEqual(configs, [("/users", "qs", 0), ("/users/<user|d>", "model", 1)])
+        self.assertEqual([e["route"] for e in actual if e["event"] == "view"], ["/users/<user|d>"])
+
+    def test_traverse_traced_with_header_setting_expect_summary_header(self):
+        user = User.objects.create(username="traced")
+        cut = PathTree(yaml=self.trace_yaml, trace_rate=1)
+
+        with self.settings(TRAVERSAL_TRACE_HEADER=True):
+            actual = cut.traverse(RequestFactory().get("/users/{}".format(user.id)))
+
+        self.assertIn("queries=1", actual["X-Traversal-Trace"])
+
+    def test_traverse_not_sampled_expect_no_trace(self):
+        request = RequestFactory().get("/users/1")
+        User.objects.create(id=1, username="traced")
+        cut = PathTree(yaml=self.trace_yaml, trace_rate=0)
+
+        cut.traverse(request)
+
+        self.assertFalse(hasattr(request, "traversal_trace"))
+
+# rejection
+    rejection_yaml = """
+path: ""
+children:
+  - path: users
+    GET: all_apps.traversal.tests.testViewOne
+    children:
+      - path: <user>
+        GET: all_apps.traversal.tests.testViewOne
+"""
+
+    def test_traverse_with_unknown_first_segment_expect_rejected_before_traversal(self):
+        cut = PathTree(yaml=self.rejection_yaml)
+
+        with self.assertRaises(Http404):
+            cut.traverse(RequestFactory().get("/wp-admin/setup.php"))
+
+        self.assertEqual(cut.rejection.counters["rejected_segment"], 1)
+
+    def test_traverse_deeper_than_tree_expect_rejected_before_traversal(self):
+        cut = PathTree(yaml=self.rejection_yaml)
+
+        with self.assertRaises(Http404):
+            cut.traverse(RequestFactory().get("/users/1/2"))
+
+        self.assertEqual(cut.rejection.counters["rejected_depth"], 1)
+
+    def test_traverse_same_miss_twice_expect_second_rejected_from_cache(self):
+        cut = PathTree(yaml=self.rejection_yaml)
+
+        for i in range(2):
+            with self.assertRaises(Http404):
+                cut.traverse(RequestFactory().post("/users"))
+
+        self.assertEqual(cut.rejection.counters["rejected_cached"], 1)
+
+    def test_traverse_with_miss_cache_full_expect_oldest_miss_evicted(self):
+        cut = PathTree(yaml=self.rejection_yaml, miss_cache_size=1)
+
+        for path in ["/users/1", "/users/2"]:
+            with self.assertRaises(Http404):
+                cut.traverse(RequestFactory().post(path))
+
+        self.assertEqual(list(cut.rejection.misses), [("POST", "/users/2")])
+
+# tail splat
+    tail_yaml = """
+path: ""
+children:
+  - path: files
+    children:
+      - path: readme
+        GET: all_apps.traversal.tests.testViewTwo
+      - path: <rest|*>
+        GET: all_apps.traversal.tests.testViewOne
+"""
+
+    def test_traverse_tail_splat_expect_rest_of_path_as_one_path_arg(self):
+        cut = PathTree(yaml=self.tail_yaml)
+
+        view, path_args, node = cut.test_traverse(RequestFactory().get("/files/docs/2014/report.pdf/"))
+
+        self.assertEqual(view, testViewOne)
+        self.assertEqual(path_args, {"rest": "docs/2014/report.pdf"})
+        self.assertEqual(node.kind, "tail")
+
+    def test_traverse_literal_before_tail_splat_expect_literal_matched(self):
+        cut = PathTree(yaml=self.tail_yaml)
+
+        view, path_args, node = cut.test_traverse(RequestFactory().get("/files/readme"))
+
+        self.assertEqual(view, testViewTwo)
+
+    def test_traverse_path_deeper_than_tree_below_tail_splat_expect_not_rejected(self):
+        cut = PathTree(yaml=self.tail_yaml)
+
+        actual = cut.traverse(RequestFactory().get("/files/a/b/c/d/e"))
+
+        self.assertEqual(actual.status_code, 200)
+        self.assertEqual(cut.rejection.counters["rejected_depth"], 0)
+
+# runtime mutation
+    mutation_yaml = """
+path: ""
+children:
+  - path: users
+    qs: ">>> all_models.auth.User.objects.all()"
+    GET: all_apps.traversal.tests.testViewOne
+    children:
+      - path: <user|d>
+        model: ">>> parent.qs.get(pk=path_args['user'])"
+        GET: all_apps.traversal.tests.testViewModel
+"""
+
+    def test_insert_expect_new_route_served_and_old_root_untouched(self):
+        cut = PathTree(yaml=self.mutation_yaml)
+        old_root = cut.root
+        with self.assertRaises(Http404):
+            cut.traverse(RequestFactory().get("/tenants"))
+
+        cut.insert("/", {"path": "tenants", "GET": "all_apps.traversal.tests.testViewOne"})
+        actual = cut.traverse(RequestFactory().get("/tenants"))
+
+        self.assertEqual(actual.content, b"success")
+        self.assertNotIn("tenants", old_root.child_dict)
+
+    def test_insert_below_copied_spine_expect_parent_values_from_current_traversal(self):
+        user = User.objects.create(username="spine")
+        cut = PathTree(yaml=self.mutation_yaml)
+
+        cut.insert("/users/<user|d>", {"path": "name", "label": ">>> parent.model.username",
+                                       "GET": "all_apps.traversal.tests.testViewOne"})
+        view, path_args, node = cut.test_traverse(RequestFactory().get("/users/{}/name".format(user.id)))
+
+        self.assertEqual(node.label, "spine")
+
+    def test_replace_expect_new_subtree_served(self):
+        cut = PathTree(yaml=self.mutation_yaml)
+
+        cut.replace("/users", {"path": "users", "GET": "all_apps.traversal.tests.testViewCount"})
+        actual = cut.traverse(RequestFactory().get("/users"))
+
+        self.assertEqual(view_calls, ["/users"])
+        self.assertNotIn("<user|d>", cut.root["users"].child_dict)
+
+    def test_remove_expect_route_rejected(self):
+        cut = PathTree(yaml=self.mutation_yaml)
+
+        cut.remove("/users/<user|d>")
+
+        with self.assertRaises(Http404):
+            cut.traverse(RequestFactory().get("/users/1"))
+        self.assertEqual(cut.rejection.counters["rejected_depth"], 1)
+
+    def test_remove_root_expect_valueerror(self):
+        cut = PathTree(yaml=self.mutation_yaml)
+
+        with self.assertRaises(ValueError):
+            cut.remove("/")
+
+    def test_insert_existing_path_expect_valueerror_and_tree_unchanged(self):
+        cut = PathTree(yaml=self.mutation_yaml)
+        root = cut.root
+
+        with self.assertRaises(ValueError):
+            cut.insert("/", {"path": "users", "POST": "all_apps.traversal.tests.testViewOne"})
+
+        self.assertIs(cut.root, root)
+        self.assertEqual([c.path for c in cut.root.children].count("users"), 1)
+
+# batch
+    def batch_request(self, entries):
+        return RequestFactory().post("/batch", json.dumps(entries), content_type="application/json")
+
+    def test_batch_expect_responses_in_order(self):
+        user = User.objects.create(username="batched")
+        cut = PathTree(yaml=self.mutation_yaml)
+
+        actual = cut.batch(self.batch_request([
+            {"method": "GET", "path": "/users/{}".format(user.id)},
+            {"path": "/missing"}]))
+
+        self.assertEqual(json.loads(actual.content.decode("utf-8")), [
+            {"method": "GET", "path": "/users/{}".format(user.id), "status": 200, "body": "batched"},
+            {"method": "GET", "path": "/missing", "status": 404, "body": None}])
+
+    def test_batch_same_path_args_expect_config_values_shared(self):
+        user = User.objects.create(username="batched")
+        cut = PathTree(yaml=self.mutation_yaml)
+        path = "/users/{}".format(user.id)
+
+        with self.assertNumQueries(1):
+            cut.batch(self.batch_request([{"path": path}, {"path": path}]))
+
+    def test_batch_after_write_entry_expect_config_values_recomputed(self):
+        user = User.objects.create(username="batched")
+        cut = PathTree(yaml=self.mutation_yaml.replace("GET: all_apps.traversal.tests.testViewModel",
+                                                       "GET, POST: all_apps.traversal.tests.testViewModel"))
+        path = "/users/{}".format(user.id)
+
+        with self.assertNumQueries(3):
+            cut.batch(self.batch_request([{"path": path}, {"method": "POST", "path": path}, {"path": path}]))
+
+    def test_batch_entry_that_raises_expect_500_and_other_entries_answered(self):
+        user = User.objects.create(username="batched")
+        cut = PathTree(yaml=self.mutation_yaml)
+
+        actual = cut.batch(self.batch_request([{"path": "/users/{}".format(user.id)}, {"path": "/users/0"}]))
+
+        self.assertEqual(actual.status_code, 200)
+        self.assertEqual([e["status"] for e in json.loads(actual.content.decode("utf-8"))], [200, 500])
+
+    def test_batch_with_non_ascii_path_expect_path_decoded(self):
+        User.objects.create(username=u"jos\xe9")
+        cut = PathTree(yaml="""
+path: ""
+children:
+  - path: users
+    children:
+      - path: <name>
+        model: ">>> all_models.auth.User.objects.get(username=path_args['name'])"
+        GET: all_apps.traversal.tests.testViewModel
+""")
+
+        actual = cut.batch(self.batch_request([{"path": u"/users/jos\xe9"}, {"path": "/users/jos%C3%A9"}]))
+
+        self.assertEqual([(e["status"], e["body"]) for e in json.loads(actual.content.decode("utf-8"))],
+                         [(200, u"jos\xe9"), (200, u"jos\xe9")])
+
+    def test_batch_with_path_not_a_string_expect_400(self):
+        cut = PathTree(yaml=self.mutation_yaml)
+
+        actual = cut.batch(self.batch_request([{"path": 5}]))
+
+        self.assertEqual(actual.status_code, 400)
+
+    def test_batch_with_invalid_body_expect_400(self):
+        cut = PathTree(yaml=self.mutation_yaml)
+
+        actual = cut.batch(self.batch_request({"path": "/users"}))
+
+        self.assertEqual(actual.status_code, 400)
+
 class TestPathNode(TestCase):
 # creation
     def test_has_self_path(self):
@@ -194,6 +622,111 @@ class TestPathNode(TestCase):
 
         self.assertEqual(actual, 5)
 
+    def test_created_with_identical_view_references_expect_children_share_one_view(self):
+        cut = PathNode(path="", children=[
+            {"path": "first", "GET": "all_apps.traversal.views.Rest.as_view()"},
+            {"path": "second", "GET": " all_apps.traversal.views.Rest.as_view() "}])
+
+        actual = cut["second"].views["GET"]
+
+        self.assertIs(actual, cut["first"].views["GET"])
+
+# view resolver
+    def test_view_resolver_resolve_called_view_reference_expect_no_exec(self):
+        cut = ViewResolver()
+
+        cut.resolve("all_apps.traversal.views.Rest.as_view()")
+        cut.resolve("all_apps.traversal.views.Rest.as_view()")
+        actual = cut.stats()
+
+        self.assertEqual(actual, {"lookups": 2, "unique": 1, "deduplicated": 1, "exec_fallbacks": 0})
+
+    def test_view_resolver_resolve_expression_expect_exec_fallback(self):
+        cut = ViewResolver()
+
+        actual = cut.resolve("(all_apps.auth.views.login)")
+
+        self.assertIs(actual, all_apps.auth.views.login)
+        self.assertEqual(cut.stats()["exec_fallbacks"], 1)
+
+# model cache
+    def model_cache_tree(self):
+        get_cache("default").clear()
+        return PathNode(path="", qs=">>> all_models.auth.User.objects.all()", children=[
+            {"path": "<user|d>", "model": ">>> parent.qs.get(pk=path_args['user'])", "cache_model": 60,
+             "GET": "all_apps.traversal.tests.testViewModel"}])
+
+    def test_model_with_cache_model_expect_second_lookup_without_query(self):
+        user = User.objects.create(username="cached")
+        cut = self.model_cache_tree()
+        req = RequestFactory().get("/{}".format(user.id))
+        cut.traverse(req, ["", str(user.id)], PathArgContainer())
+        cut["<user|d>"].model
+
+        cut.traverse(req, ["", str(user.id)], PathArgContainer())
+        with self.assertNumQueries(0):
+            actual = cut["<user|d>"].model
+
+        self.assertEqual(actual, user)
+
+    def test_model_with_cache_model_after_save_expect_fresh_object(self):
+        user = User.objects.create(username="cached")
+        cut = self.model_cache_tree()
+        req = RequestFactory().get("/{}".format(user.id))
+        cut.traverse(req, ["", str(user.id)], PathArgContainer())
+        cut["<user|d>"].model
+
+        user.username = "renamed"
+        user.save()
+        cut.traverse(req, ["", str(user.id)], PathArgContainer())
+        actual = cut["<user|d>"].model
+
+        self.assertEqual(actual.username, "renamed")
+
+    def test_model_cache_stats_expect_hit_ratio(self):
+        cut = ModelCache()
+        cut.hits, cut.misses = 3, 1
+
+        actual = cut.stats()["hit_ratio"]
+
+        self.assertEqual(actual, 0.75)
+
+# single flight
+    def test_single_flight_concurrent_evaluations_expect_one_call_shared(self):
+        del slow_calls[:]
+        slow_release.clear()
+        cut = PathNode(path="", value=">>> all_apps.traversal.tests.slowValue()", single_flight=["value"])
+        cut.path_args = PathArgContainer()
+        coalesced = single_flight.coalesced
+        pool = ThreadPool(4)
+
+        results = pool.map_async(lambda i: cut._evaluate("value", cut._config["value"]), range(4))
+        deadline = time.time() + 5
+        while single_flight.coalesced - coalesced < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        slow_release.set()
+        actual = results.get(5)
+        pool.close()
+
+        self.assertEqual(actual, [1, 1, 1, 1])
+        self.assertEqual(slow_calls, [1])
+        self.assertEqual(single_flight.coalesced - coalesced, 3)
+        self.assertEqual(single_flight.stats()["in_flight"], 0)
+
+    def test_single_flight_key_expect_given_path_args_not_node_state(self):
+        cut = PathNode(path="", value=">>> 1", single_flight=True)
+        cut.path_args = {"id": "1"}
+
+        actual = single_flight.key(cut, "value", {"id": "2"})
+
+        self.assertEqual(actual[2], frozenset([("id", "2")]))
+
+    def test_single_flight_not_declared_for_key_expect_not_coalesced(self):
+        cut = PathNode(path="", value=">>> 1", other=">>> 2", single_flight=["other"])
+
+        self.assertFalse(single_flight.enabled(cut, "value"))
+        self.assertTrue(single_flight.enabled(cut, "other"))
+
 # __getattr__
     def test_getattr_returns_attributeerror_if_not_in_conf(self):
         cut = PathNode(path="", conf1="hello")
@@ -330,6 +863,21 @@ class TestPathNode(TestCase):
         actual = cut.match("5")
         self.assertEqual(actual, {"id": 5})
 
+    def test_created_with_tail_splat_path_expect_tail_kind(self):
+        cut = PathNode(path="<rest|*>")
+
+        self.assertEqual(cut.kind, "tail")
+        self.assertEqual(cut.name, "rest")
+
+    def test_traverse_tail_splat_without_request_path_expect_rest_of_path_joined(self):
+        req = Request()
+        req.method = "GET"
+        cut = PathNode(path="", children=[{"path": "<rest|*>", "GET": "all_apps.auth.views.login"}])
+
+        actual = cut.traverse(req, ["", "a", "b"], PathArgContainer())
+
+        self.assertEqual(actual[1], {"rest": "a/b"})
+
     def test_match_when_passed_string_not_matching_int_splat_expect_none(self):
         cut = PathNode(path="<id|d>")
         
@@ -397,6 +945,30 @@ class TestPathNode(TestCase):
         result = pathNode.traverse(req, ["1"], PathArgContainer())
         self.assertEqual(result[1]['user'], "1")
 
+    def test_traverse_path_deeper_than_recursion_limit_expect_destination_view(self):
+        depth = sys.getrecursionlimit() + 100
+        config = {"path": "n{}".format(depth - 1), "GET": "all_apps.auth.views.logout"}
+        for i in reversed(range(depth - 1)):
+            config = {"path": "n{}".format(i), "children": [config]}
+        cut = PathNode(**config)
+        req = Request()
+        req.method = "GET"
+        path = ["n{}".format(i) for i in range(depth)]
+
+        actual = cut.traverse(req, path, PathArgContainer())
+
+        self.assertEqual(actual[0], all_apps.auth.views.logout)
+        self.assertEqual(actual[2].path, "n{}".format(depth - 1))
+        self.assertEqual(len(path), depth)
+
+    def test_traverse_child_matches_but_rest_of_path_does_not_expect_404_without_trying_siblings(self):
+        req = Request()
+        req.method = "GET"
+        cut = PathNode(path="", children=[{"path": "<any>"}, {"path": "first", "GET": "all_apps.auth.views.login"}])
+
+        with self.assertRaises(Http404):
+            cut.traverse(req, ["", "first"], PathArgContainer())
+
     def test_traverse_returns_node(self):
         user = all_models.auth.User(username='testuser')
         user.save()
@@ -461,3 +1033,705 @@ class TestPathArgContainer(TestCase):
         actual = cut.current
         self.assertEqual(actual, {"test": 5})
 
+
+
+class TestRest(TestCase):
+    yaml = """
+path: ""
+children:
+  - path: users
+    qs: ">>> all_models.auth.User.objects.all()"
+    serializer: ">>> all_apps.traversal.serializers.UserSerializer"
+    fields: [id, username, first_name]
+    batch_size: 2
+    GET, POST, PUT, PATCH, DELETE: all_apps.traversal.views.Rest.as_view()
+"""
+
+    def request(self, method, path, data):
+        return RequestFactory().generic(method.upper(), path, json.dumps(data), content_type="application/json")
+
+# values
+    def test_get_collection_with_fields_expect_rows_of_fields_in_one_query(self):
+        users = [User.objects.create(username="user{}".format(i)) for i in range(3)]
+        cut = PathTree(yaml=self.yaml)
+
+        with self.assertNumQueries(1):
+            actual = cut.traverse(RequestFactory().get("/users"))
+
+        self.assertEqual(actual.data, [{"id": u.id, "username": u.username, "first_name": ""} for u in users])
+
+    def test_get_collection_with_fields_param_expect_only_requested_fields(self):
+        user = User.objects.create(username="user")
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(RequestFactory().get("/users", {"fields": "username"}))
+
+        self.assertEqual(actual.data, [{"username": "user"}])
+
+    def test_get_collection_with_undeclared_field_param_expect_400(self):
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(RequestFactory().get("/users", {"fields": "username,password"}))
+
+        self.assertEqual(actual.status_code, 400)
+        self.assertIn("password", actual.data["fields"][0])
+
+# bulk create
+    def test_post_list_to_collection_expect_all_created(self):
+        cut = PathTree(yaml=self.yaml)
+        data = [{"username": "user{}".format(i)} for i in range(5)]
+
+        actual = cut.traverse(self.request("post", "/users", data))
+
+        self.assertEqual(actual.status_code, 201)
+        self.assertEqual(actual.data, {"count": 5})
+        self.assertEqual(User.objects.filter(username__startswith="user").count(), 5)
+
+    def test_post_list_with_invalid_item_expect_per_item_errors_and_nothing_created(self):
+        cut = PathTree(yaml=self.yaml)
+        data = [{"username": "good"}, {"username": ""}]
+
+        actual = cut.traverse(self.request("post", "/users", data))
+
+        self.assertEqual(actual.status_code, 400)
+        self.assertEqual(actual.data[0], {})
+        self.assertIn("username", actual.data[1])
+        self.assertFalse(User.objects.filter(username="good").exists())
+
+# bulk update
+    def test_put_list_to_collection_expect_all_updated(self):
+        users = [User.objects.create(username="user{}".format(i)) for i in range(3)]
+        cut = PathTree(yaml=self.yaml)
+        data = [{"id": u.id, "username": u.username, "first_name": "bulk"} for u in users]
+
+        actual = cut.traverse(self.request("put", "/users", data))
+
+        self.assertEqual(actual.data, {"count": 3})
+        self.assertEqual(User.objects.filter(first_name="bulk").count(), 3)
+
+    def test_put_list_with_unknown_id_expect_per_item_errors_and_nothing_updated(self):
+        user = User.objects.create(username="user")
+        cut = PathTree(yaml=self.yaml)
+        data = [{"id": user.id, "username": "user", "first_name": "bulk"}, {"id": 0, "username": "x"}]
+
+        actual = cut.traverse(self.request("put", "/users", data))
+
+        self.assertEqual(actual.status_code, 400)
+        self.assertEqual(actual.data, [{}, {"id": ["Not found."]}])
+        self.assertEqual(User.objects.get(pk=user.id).first_name, "")
+
+
+    def test_put_list_with_string_id_expect_updated(self):
+        user = User.objects.create(username="user")
+        cut = PathTree(yaml=self.yaml)
+        data = [{"id": str(user.id), "username": "user", "first_name": "bulk"}]
+
+        actual = cut.traverse(self.request("put", "/users", data))
+
+        self.assertEqual(actual.data, {"count": 1})
+        self.assertEqual(User.objects.get(pk=user.id).first_name, "bulk")
+
+    def test_put_object_to_collection_expect_400(self):
+        user = User.objects.create(username="user")
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(self.request("put", "/users", {"id": user.id, "username": "user", "first_name": "bulk"}))
+
+        self.assertEqual(actual.status_code, 400)
+        self.assertEqual(actual.data, {"non_field_errors": ["Expected a list."]})
+        self.assertEqual(User.objects.get(pk=user.id).first_name, "")
+
+    def test_put_list_with_item_not_an_object_expect_per_item_errors(self):
+        user = User.objects.create(username="user")
+        cut = PathTree(yaml=self.yaml)
+        data = [{"id": user.id, "username": "user", "first_name": "bulk"}, 1]
+
+        actual = cut.traverse(self.request("put", "/users", data))
+
+        self.assertEqual(actual.status_code, 400)
+        self.assertEqual(actual.data, [{}, {"non_field_errors": ["Expected an object."]}])
+        self.assertEqual(User.objects.get(pk=user.id).first_name, "")
+
+    def test_post_list_with_item_not_an_object_expect_per_item_errors(self):
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(self.request("post", "/users", [{"username": "good"}, "bad"]))
+
+        self.assertEqual(actual.status_code, 400)
+        self.assertEqual(actual.data, [{}, {"non_field_errors": ["Expected an object."]}])
+
+# bulk patch and delete
+    def test_patch_collection_expect_all_updated_in_one_update(self):
+        for i in range(3):
+            User.objects.create(username="user{}".format(i))
+        cut = PathTree(yaml=self.yaml)
+        self.addCleanup(setattr, model_cache, "watching", model_cache.watching)
+        model_cache.watching = False
+
+        with self.assertNumQueries(1):
+            actual = cut.traverse(self.request("patch", "/users", {"first_name": "bulk"}))
+
+        self.assertEqual(actual.data, {"count": 3})
+        self.assertEqual(User.objects.filter(first_name="bulk").count(), 3)
+
+    def test_patch_collection_with_cache_model_child_expect_cached_object_invalidated(self):
+        get_cache("default").clear()
+        user = User.objects.create(username="before")
+        cut = PathTree(yaml=self.yaml + """
+    children:
+      - path: <user|d>
+        model: ">>> parent.qs.get(pk=path_args['user'])"
+        cache_model: 60
+        GET: all_apps.traversal.tests.testViewModel
+""")
+        path = "/users/{}".format(user.id)
+        cut.traverse(RequestFactory().get(path))
+
+        cut.traverse(self.request("patch", "/users", {"username": "after"}))
+        actual = cut.traverse(RequestFactory().get(path))
+
+        self.assertEqual(actual.content, b"after")
+
+    def test_patch_collection_with_object_cached_by_other_route_expect_cached_object_invalidated(self):
+        get_cache("default").clear()
+        user = User.objects.create(username="user")
+        group = Group.objects.create(name="before")
+        user.groups.add(group)
+        cut = PathTree(yaml="""
+path: ""
+children:
+  - path: users
+    children:
+      - path: <user|d>
+        children:
+          - path: groups
+            qs: ">>> all_models.auth.Group.objects.filter(user__pk=path_args['user'])"
+            serializer: ">>> all_apps.traversal.serializers.GroupSerializer"
+            PATCH: all_apps.traversal.views.Rest.as_view()
+  - path: groups
+    qs: ">>> all_models.auth.Group.objects.all()"
+    children:
+      - path: <group|d>
+        model: ">>> parent.qs.get(pk=path_args['group'])"
+        cache_model: 60
+        GET: all_apps.traversal.tests.testViewTwo
+""")
+        path = "/groups/{}".format(group.id)
+        cut.traverse(RequestFactory().get(path))[0].model
+
+        cut.traverse(self.request("patch", "/users/{}/groups".format(user.id), {"name": "after"}))
+        actual = cut.traverse(RequestFactory().get(path))[0].model
+
+        self.assertEqual(actual.name, "after")
+
+    def test_patch_collection_with_limit_expect_only_limit_updated(self):
+        for i in range(3):
+            User.objects.create(username="user{}".format(i))
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(self.request("patch", "/users?limit=2", {"first_name": "bulk"}))
+
+        self.assertEqual(actual.data, {"count": 2})
+        self.assertEqual(User.objects.filter(first_name="bulk").count(), 2)
+
+    def test_patch_collection_with_read_only_field_expect_400_and_nothing_updated(self):
+        user = User.objects.create(username="user")
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(self.request("patch", "/users", {"id": 0, "first_name": "bulk"}))
+
+        self.assertEqual(actual.status_code, 400)
+        self.assertEqual(actual.data, {"id": ["Cannot be updated in bulk."]})
+        self.assertEqual(User.objects.get(pk=user.id).first_name, "")
+
+    def test_patch_collection_with_invalid_value_expect_400(self):
+        User.objects.create(username="user")
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(self.request("patch", "/users", {"first_name": "x" * 100}))
+
+        self.assertEqual(actual.status_code, 400)
+        self.assertIn("first_name", actual.data)
+
+    def test_delete_collection_with_limit_expect_count_and_rest_kept(self):
+        for i in range(3):
+            User.objects.create(username="user{}".format(i))
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(RequestFactory().delete("/users?limit=2"))
+
+        self.assertEqual(actual.data, {"count": 2})
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_delete_collection_with_bad_limit_expect_400(self):
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(RequestFactory().delete("/users?limit=-1"))
+
+        self.assertEqual(actual.status_code, 400)
+
+
+class TestAppRing(TestCase):
+    def test_module_attribute_twice_expect_same_wrapper(self):
+        first = all_apps.traversal.views
+
+        actual = all_apps.traversal.views
+
+        self.assertIs(actual, first)
+
+    def test_registry_lookup_expect_object_resolved_through_apps(self):
+        actual = registry.lookup("all_apps.traversal.views.Rest")
+
+        self.assertIs(actual, all_apps.traversal.views.Rest)
+        self.assertIn("apps.traversal.views.Rest", registry)
+
+    def test_registry_lookup_expect_model_resolved_through_models(self):
+        actual = registry.lookup("models.auth.User")
+
+        self.assertIs(actual, User)
+
+    def test_model_package_with_unknown_model_expect_attributeerror(self):
+        with self.assertRaises(AttributeError):
+            all_models.auth.NotAModel
+
+    def test_import_tracer_enabled_expect_lazy_import_recorded_with_trigger_and_cause(self):
+        import wsgiref
+        sys.modules.pop("wsgiref.validate", None)
+        wsgiref.__dict__.pop("validate", None)
+        tracer = appring.import_tracer
+        tracer.enabled = True
+        tracer.reset()
+        try:
+            cut = appring.ModuleWrapper(wsgiref, "wsgiref", "apps.wsgiref", appring.Registry())
+            with tracer.cause("/users:model"):
+                cut.validate
+        finally:
+            tracer.enabled = False
+
+        actual = tracer.report()
+
+        self.assertEqual(len(actual), 1)
+        self.assertEqual(actual[0]["module"], "wsgiref.validate")
+        self.assertEqual(actual[0]["cause"], "/users:model")
+        self.assertEqual(tracer.preload_list(), ["apps.wsgiref.validate"])
+
+    def test_import_tracer_enabled_with_missing_attribute_expect_nothing_recorded(self):
+        import wsgiref
+        tracer = appring.import_tracer
+        tracer.enabled = True
+        tracer.reset()
+        try:
+            cut = appring.ModuleWrapper(wsgiref, "wsgiref", "apps.wsgiref", appring.Registry())
+            self.assertFalse(hasattr(cut, "not_a_module"))
+        finally:
+            tracer.enabled = False
+
+        self.assertEqual(tracer.preload_list(), [])
+
+
+class TestLint(TestCase):
+    yaml = """
+path: ""
+GET: all_apps.traversal.tests.testViewOne
+children:
+  - path: <name>
+    GET: all_apps.traversal.tests.testViewOne
+  - path: users
+    GET: all_apps.traversal.tests.testViewOne
+  - path: ^(?P<slug>(\\w+)*)$
+    regex: True
+    qs: ">>> all_models.auth.User.objects.all()"
+    GET: all_apps.traversal.tests.testViewOne
+  - path: empty
+"""
+
+    def issues(self, yaml):
+        return {(i.code, i.route) for i in lint_tree(PathTree(yaml=yaml))}
+
+    def test_lint_splat_before_literal_expect_literal_shadowed(self):
+        actual = self.issues(self.yaml)
+
+        self.assertIn(("shadowed", "/users"), actual)
+
+    def test_lint_nested_quantifier_expect_backtracking_error(self):
+        actual = self.issues(self.yaml)
+
+        self.assertIn(("regex-backtracking", "/^(?P<slug>(\\w+)*)$"), actual)
+
+    def test_lint_node_without_views_or_children_expect_dead_end(self):
+        actual = self.issues(self.yaml)
+
+        self.assertIn(("dead-end", "/empty"), actual)
+
+    def test_lint_unsliced_qs_expect_unbounded_warning(self):
+        actual = self.issues(self.yaml)
+
+        self.assertIn(("unbounded-queryset", "/^(?P<slug>(\\w+)*)$"), actual)
+
+    def test_lint_sliced_qs_expect_no_warning(self):
+        actual = self.issues("""
+path: ""
+qs: ">>> all_models.auth.User.objects.all()[:100]"
+GET: all_apps.traversal.tests.testViewOne
+""")
+
+        self.assertEqual(actual, set())
+
+    def test_lint_child_of_tail_splat_expect_child_shadowed(self):
+        actual = self.issues("""
+path: ""
+children:
+  - path: <rest|*>
+    GET: all_apps.traversal.tests.testViewOne
+    children:
+      - path: edit
+        GET: all_apps.traversal.tests.testViewOne
+  - path: about
+    GET: all_apps.traversal.tests.testViewOne
+""")
+
+        self.assertEqual(actual, {("shadowed", "/<rest|*>/edit"), ("shadowed", "/about")})
+
+    def test_lintroutes_command_with_errors_expect_commanderror(self):
+        with tempfile.NamedTemporaryFile(suffix=".yaml") as f:
+            f.write(self.yaml.encode("utf-8"))
+            f.flush()
+
+            with self.assertRaises(CommandError):
+                call_command("lintroutes", f.name, stdout=six.StringIO())
+
+
+class TestRouteTable(TestCase):
+    yaml = """
+path: ""
+children:
+  - path: users
+    qs: ">>> all_models.auth.User.objects.all()"
+    GET,POST: all_apps.traversal.tests.testViewOne
+    children:
+      - path: <user|d>
+        model: ">>> parent.qs.get(pk=path_args['user'])"
+        GET: all_apps.traversal.tests.testViewTwo
+  - path: ^v(?P<version>\\d+)$
+    regex: True
+    GET: all_apps.traversal.tests.testViewOne
+  - path: files
+    children:
+      - path: <rest|*>
+        GET: all_apps.traversal.tests.testViewOne
+"""
+
+    def tree(self):
+        f = tempfile.NamedTemporaryFile(suffix=".table")
+        self.addCleanup(f.close)
+        tree = PathTree(yaml=self.yaml)
+        build(tree.conf, f.name)
+        return PathTree(table=RouteTable(f.name))
+
+    def test_traverse_table_expect_view_and_path_args(self):
+        cut = self.tree()
+
+        view, path_args, node = cut.test_traverse(RequestFactory().get("/users/5"))
+
+        self.assertEqual(view, testViewTwo)
+        self.assertEqual(path_args, {"user": 5})
+        self.assertEqual(node.parent.path, "users")
+
+    def test_traverse_table_expect_nodes_made_only_for_resolved_path(self):
+        cut = self.tree()
+
+        cut.test_traverse(RequestFactory().get("/users/5"))
+
+        self.assertEqual(sorted(n.path for n in cut.table._nodes.values()), ["", "<user|d>", "users"])
+
+    def test_traverse_table_with_config_expect_config_evaluated(self):
+        user = User.objects.create(username="table")
+        cut = self.tree()
+
+        view, path_args, node = cut.test_traverse(RequestFactory().get("/users/{}".format(user.id)))
+
+        self.assertEqual(node.model, user)
+
+    def test_traverse_table_regex_and_tail_expect_matched(self):
+        cut = self.tree()
+
+        regex = cut.test_traverse(RequestFactory().get("/v2"))[1]
+        tail = cut.test_traverse(RequestFactory().get("/files/a/b.txt"))[1]
+
+        self.assertEqual(regex, {"version": "2"})
+        self.assertEqual(tail, {"rest": "a/b.txt"})
+
+    def test_traverse_table_without_method_expect_404(self):
+        cut = self.tree()
+
+        with self.assertRaises(Http404):
+            cut.traverse(RequestFactory().post("/users/5"))
+
+    def test_table_tree_expect_rejection_filter_indexes_whole_table(self):
+        cut = self.tree()
+
+        self.assertEqual(cut.rejection.literals[1]["users"], 1)
+        self.assertEqual(cut.rejection.tails, [0, 0, 1])
+
+    def test_insert_into_table_tree_expect_valueerror(self):
+        cut = self.tree()
+
+        with self.assertRaises(ValueError):
+            cut.insert("/users", {"path": "new"})
+
+    def test_buildroutes_command_expect_table_written(self):
+        with tempfile.NamedTemporaryFile(suffix=".yaml") as source:
+            source.write(self.yaml.encode("utf-8"))
+            source.flush()
+            table = tempfile.NamedTemporaryFile(suffix=".table")
+            self.addCleanup(table.close)
+
+            call_command("buildroutes", source.name, table.name, stdout=six.StringIO())
+
+        self.assertEqual(RouteTable(table.name).node_count, 6)
+
+
+class TestRouters(TestCase):
+    yaml = """
+path: ""
+children:
+  - path: users
+    qs: ">>> all_models.auth.User.objects.all()"
+    GET: all_apps.traversal.tests.testViewUsernames
+    POST: all_apps.traversal.tests.testViewOne
+  - path: primary
+    read_db: default
+    qs: ">>> all_models.auth.User.objects.all()"
+    GET: all_apps.traversal.tests.testViewUsernames
+"""
+
+    def setUp(self):
+        User.objects.create(username="written")
+
+    @override_settings(TRAVERSAL_READ_DATABASES=["replica"])
+    def test_get_with_replicas_expect_read_from_replica(self):
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(RequestFactory().get("/users"))
+
+        self.assertEqual(actual.content, b"")
+
+    def test_get_without_replicas_expect_read_from_primary(self):
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(RequestFactory().get("/users"))
+
+        self.assertEqual(actual.content, b"written")
+
+    @override_settings(TRAVERSAL_READ_DATABASES=["replica"])
+    def test_get_node_with_read_db_expect_read_from_its_database(self):
+        cut = PathTree(yaml=self.yaml)
+
+        actual = cut.traverse(RequestFactory().get("/primary"))
+
+        self.assertEqual(actual.content, b"written")
+
+    @override_settings(TRAVERSAL_READ_DATABASES=["replica"])
+    def test_get_with_values_prefetched_on_pool_expect_querysets_on_replica(self):
+        cut = PathTree(yaml="""
+path: ""
+children:
+  - path: users
+    prefetch: [qs, staff]
+    qs: ">>> all_models.auth.User.objects.all()"
+    staff: ">>> all_models.auth.User.objects.filter(is_staff=True)"
+    GET: all_apps.traversal.tests.testViewOne
+""", prefetch_workers=2)
+
+        cut.traverse(RequestFactory().get("/users"))
+
+        values = cut.root["users"]._config_values
+        self.assertEqual((values["qs"].db, values["staff"].db), ("replica", "replica"))
+
+    @override_settings(TRAVERSAL_READ_DATABASES=["replica"], TRAVERSAL_STICKY_SECONDS=30)
+    def test_get_after_write_expect_sticky_cookie_and_read_from_primary(self):
+        cut = PathTree(yaml=self.yaml)
+        write = cut.traverse(RequestFactory().post("/users"))
+        request = RequestFactory().get("/users")
+        request.COOKIES["traversal_primary"] = write.cookies["traversal_primary"].value
+
+        actual = cut.traverse(request)
+
+        self.assertEqual(write.cookies["traversal_primary"]["max-age"], 30)
+        self.assertEqual(actual.content, b"written")
+
+    def test_get_with_expired_sticky_cookie_expect_not_sticky(self):
+        request = RequestFactory().get("/users")
+        request.COOKIES["traversal_primary"] = "1"
+
+        self.assertFalse(routers.is_sticky(request))
+
+    def test_write_object_read_from_replica_expect_primary(self):
+        user = User(username="replicated")
+        user._state.db = "replica"
+
+        actual = routers.ReplicaRouter().db_for_write(User, instance=user)
+
+        self.assertEqual(actual, "default")
+
+
+@override_settings(TRAVERSAL_ENFORCE_QUERY_BUDGETS=True, TRAVERSAL_QUERY_BUDGET_ACTION="raise")
+class TestQueryBudget(TestCase):
+    yaml = """
+path: ""
+total: ">>> all_models.auth.User.objects.count()"
+children:
+  - path: users
+    query_budget: 2
+    qs: ">>> all_models.auth.User.objects.all()"
+    total: ">>> parent.total"
+    GET: all_apps.traversal.tests.testViewGroupsPerUser
+  - path: total
+    query_budget: 0
+    total: ">>> parent.total"
+    GET: all_apps.traversal.tests.testViewCount
+"""
+
+    def setUp(self):
+        query_stats.reset()
+
+    def test_view_within_budget_expect_queries_recorded(self):
+        User.objects.create(username="one")
+        cut = PathTree(yaml=self.yaml)
+
+        cut.traverse(RequestFactory().get("/users"))
+
+        actual = query_stats.stats()["/users"]
+        self.assertEqual((actual["requests"], actual["queries"], actual["over_budget"]), (1, 2, 0))
+
+    def test_view_with_n_plus_one_over_budget_expect_raise(self):
+        for i in range(3):
+            User.objects.create(username="user{}".format(i))
+        cut = PathTree(yaml=self.yaml)
+
+        with self.assertRaises(QueryBudgetExceeded):
+            cut.traverse(RequestFactory().get("/users"))
+
+        self.assertEqual(query_stats.stats()["/users"]["over_budget"], 1)
+
+    def test_config_evaluated_through_child_expect_queries_counted_against_parent(self):
+        node = PathTree(yaml=self.yaml).root["total"]
+        with budget.Ledger() as ledger:
+            ledger.measure(node, lambda: node.total)
+        ledger.settle()
+
+        actual = query_stats.stats()
+
+        self.assertEqual(actual["/"]["queries"], 1)
+        self.assertEqual(actual["/total"]["queries"], 0)
+
+    def test_measure_in_pool_thread_with_active_ledger_expect_queries_counted(self):
+        node = PathTree(yaml=self.yaml).root["users"]
+        pool = sharedPool(self)
+
+        def count():
+            with budget.active(ledger):
+                return ledger.measure(node, lambda: User.objects.count())
+        with budget.Ledger() as ledger:
+            pool.apply(count)
+        ledger.settle()
+
+        self.assertEqual(query_stats.stats()["/users"]["queries"], 1)
+
+    def test_active_ledger_exited_in_pool_thread_expect_queries_log_restored(self):
+        node = PathTree(yaml=self.yaml).root["users"]
+        pool = sharedPool(self)
+        ledger = budget.Ledger()
+        before = len(connections["default"].queries)
+
+        def count():
+            with budget.active(ledger):
+                ledger.measure(node, lambda: User.objects.count())
+            return len(connections["default"].queries)
+        actual = pool.apply(count)
+
+        self.assertEqual(actual, before)
+        self.assertEqual(ledger.nodes["/users"][1], 1)
+
+    @override_settings(TRAVERSAL_ENFORCE_QUERY_BUDGETS=False)
+    def test_budget_not_enforced_and_not_sampled_expect_nothing_recorded(self):
+        cut = PathTree(yaml=self.yaml)
+
+        cut.traverse(RequestFactory().get("/users"))
+
+        self.assertEqual(query_stats.stats(), {})
+
+
+class TestDependencies(TestCase):
+    yaml = """
+path: ""
+children:
+  - path: users
+    qs: ">>> all_models.auth.User.objects.all()"
+    serializer: ">>> all_apps.traversal.serializers.UserSerializer"
+    children:
+      - path: <user|d>
+        model: ">>> parent.qs.get(pk=path_args['user'])"
+        serializer: ">>> parent.serializer"
+        label: ">>> node.parent.path + str(node.model.pk)"
+        GET: all_apps.traversal.tests.testViewModel
+"""
+
+    def test_references_expect_node_and_parent_values(self):
+        actual = dependencies.references("parent.qs.get(pk=node.arg) or parent.parent.name")
+
+        self.assertEqual(actual, {(1, "qs"), (0, "arg"), (2, "name")})
+
+    def test_layers_expect_dependencies_before_dependents(self):
+        cut = PathTree(yaml=self.yaml).root["users"]["<user|d>"]
+
+        actual = [[(n.route, k) for n, k in layer] for layer in dependencies.layers(cut, ["label", "serializer"])]
+
+        self.assertEqual(actual, [
+            [("/users", "qs"), ("/users", "serializer")],
+            [("/users/<user|d>", "model"), ("/users/<user|d>", "serializer")],
+            [("/users/<user|d>", "label")]])
+
+    def test_layers_with_cycle_expect_valueerror(self):
+        cut = PathNode(path="", a=">>> node.b", b=">>> node.a")
+
+        with self.assertRaises(ValueError):
+            dependencies.layers(cut, ["a"])
+
+    def test_prefetch_with_pool_expect_values_evaluated(self):
+        cut = PathNode(path="", a=">>> 1", b=">>> 2", c=">>> node.a + node.b")
+
+        dependencies.prefetch(cut, ["c"], ThreadPool(2))
+
+        self.assertEqual(cut._config_values, {"a": 1, "b": 2, "c": 3})
+
+    @override_settings(TRAVERSAL_ENFORCE_QUERY_BUDGETS=True, TRAVERSAL_QUERY_BUDGET_ACTION="raise")
+    def test_prefetch_with_pool_expect_read_db_and_query_budget_applied(self):
+        query_stats.reset()
+        tree = PathTree(yaml="""
+path: ""
+children:
+  - path: counted
+    read_db: replica
+    query_budget: 0
+    prefetch: [qs, total]
+    qs: ">>> all_models.auth.User.objects.all()"
+    total: ">>> all_models.auth.User.objects.using('default').count()"
+    GET: all_apps.traversal.tests.testViewOne
+""", prefetch_workers=2)
+        tree.pool = sharedPool(self)
+
+        with self.assertRaises(QueryBudgetExceeded):
+            tree.traverse(RequestFactory().get("/counted"))
+
+        self.assertEqual(tree.root["counted"]._config_values["qs"].db, "replica")
+        self.assertEqual(query_stats.stats()["/counted"]["queries"], 1)
+
+    def test_traverse_node_with_prefetch_expect_values_ready_before_view(self):
+        user = User.objects.create(username="prefetched")
+        tree = PathTree(yaml=self.yaml.replace("GET:", "prefetch: [label]\n        GET:"))
+
+        tree.traverse(RequestFactory().get("/users/{}".format(user.id)))
+        actual = tree.root["users"]["<user|d>"]._config_values
+
+        self.assertEqual(actual["label"], "users{}".format(user.id))
@@ -0,0 +1,150 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("traversal.trace")
+
+_local = threading.local()
+
+
+def query_count():
+    """
+    number of queries logged so far on all connections of this thread. queries are
+    only logged while a connection uses its debug cursor (see `debug_cursors`).
+    """
+    return sum(len(c.queries) for c in connections.all())
+
+
+class debug_cursors(object):
+    """
+    context manager that makes every connection log its queries, whatever DEBUG is.
+    with truncate, the queries logged inside are dropped on exit, for threads that
+    no request_started ever resets, such as pool threads.
+    """
+    def __init__(self, truncate=False):
+        self.truncate = truncate
+
+    def __enter__(self):
+        self.previous = [(c, c.use_debug_cursor, len(c.queries)) for c in connections.all()]
+        for c, _, _ in self.previous:
+            c.use_debug_cursor = True
+
+    def __exit__(self, *exc):
+        for c, use_debug_cursor, logged in self.previous:
+            c.use_debug_cursor = use_debug_cursor
+            if self.truncate:
+                del c.queries[logged:]
+
+
+def current():
+    """
+    the Trace being recorded in this thread, or None
+    """
+    return getattr(_local, "trace", None)
+
+
+class active(object):
+    """
+    context manager that makes trace, which may be None, the current one in this
+    thread, e.g. in a pool thread evaluating values for the request's thread
+    """
+    def __init__(self, trace):
+        self.trace = trace
+
+    def __enter__(self):
+        self._previous = current()
+        _local.trace = self.trace
+        if self.trace is not None:
+            self._cursors = debug_cursors(truncate=True)
+            self._cursors.__enter__()
+        return self.trace
+
+    def __exit__(self, *exc):
+        if self.trace is not None:
+            self._cursors.__exit__(*exc)
+        _local.trace = self._previous
+
+
+def should_trace(request, rate):
+    """
+    sample a request at rate (0 to 1). in DEBUG a request can also ask for a trace
+    with the X-Traversal-Trace header.
+    """
+    if settings.DEBUG and request.META.get("HTTP_X_TRAVERSAL_TRACE"):
+        return True
+    return rate > 0 and random.random() < rate
+
+
+class Trace(object):
+    """
+    a record of one traversal: each matcher tried and its outcome, each config
+    value evaluated with its duration and query count, and the view dispatch.
+    """
+    def __init__(self, request):
+        self.path = request.path
+        self.method = request.method
+        self.events = []
+        self.start = time.time()
+        self.seconds = None
+        self.queries = None
+
+    def __enter__(self):
+        self._previous = current()
+        _local.trace = self
+        self._cursors = debug_cursors()
+        self._cursors.__enter__()
+        self._queries = query_count()
+        return self
+
+    def __exit__(self, *exc):
+        self.queries = query_count() - self._queries
+        self._cursors.__exit__(*exc)
+        _local.trace = self._previous
+        self.seconds = time.time() - self.start
+
+    def match(self, node, segment, matched):
+        self.events.append({"event": "match", "route": node.route, "segment": segment, "matched": matched})
+
+    def timed(self, event, fn, **info):
+        """
+        call fn, recording its duration and query count as an event
+        """
+        queries = query_count()
+        start = time.time()
+        try:
+            return fn()
+        finally:
+            info.update(event=event, seconds=time.time() - start, queries=query_count() - queries)
+            self.events.append(info)
+
+    def config(self, node, name, fn):
+        return self.timed("config", fn, route=node.route, key=name)
+
+    def view(self, node, fn):
+        return self.timed("view", fn, route=node.route)
+
+    def summary(self):
+        """
+        a one line summary, used for the response header
+        """
+        return "total={:.1f}ms matches={} configs={} queries={}".format(
+            (self.seconds or 0) * 1000,
+            len([e for e in self.events if e["event"] == "match"]),
+            len([e for e in self.events if e["event"] == "config"]),
+            self.queries or 0)
+
+    def emit(self, request, response):
+        """
+        attach the trace to the request, log it, and add a summary header to
+        response if TRAVERSAL_TRACE_HEADER (default: DEBUG) is set
+        """
+        request.traversal_trace = self
+        logger.debug("%s %s %s", self.method, self.path, self.summary(),
+                     extra={"trace": self.events})
+        if response is not None and getattr(settings, "TRAVERSAL_TRACE_HEADER", settings.DEBUG):
+            response["X-Traversal-Trace"] = self.summary()
@@ -1,14 +1,35 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 import yaml as YAML
 import re
-from django.http import Http404
+import io
+import json
+import logging
+import sys
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotFound, HttpResponseServerError
+from django.core.handlers.wsgi import WSGIRequest
+from django.utils.encoding import iri_to_uri
 from collections import OrderedDict
 import types
+import functools
+import threading
+from multiprocessing.pool import ThreadPool
+from django.conf import settings
 from django.utils import six
+from django.utils.six.moves.urllib.parse import unquote
 
-from .appring import apps as all_apps, models as all_models
+from .appring import apps as all_apps, models as all_models, import_tracer, registry
+from . import budget, conditional, dependencies, routers, tracing
+from .cache import TreeCache
+from .modelcache import model_cache
+from .singleflight import single_flight
+from .rejection import RejectionFilter
 
-splatRe = re.compile(r'^\<(\w*)(?:\|(\w*))?\>$')
+# where a batch entry that fails is logged, as django logs a failed request
+request_logger = logging.getLogger("django.request")
+
+splatRe = re.compile(r'^\<(\w*)(?:\|(\w*|\*))?\>$')
+# a view reference that can be resolved without exec: a dotted path, optionally called with no arguments
+viewRe = re.compile(r'^all_apps((?:\.\w+)+)(\(\))?$')
 
 def is_string_match(self, path_part):
     return {} if path_part == self.path else None
@@ -26,6 +47,19 @@ def is_int_match(self, path_part):
     except:
         return None
 
+def _tail(request, path, i, offset):
+    """
+    the path from segment i on. when path was split from request.path, as it is by
+    PathTree, this is a slice of request.path at offset, without the trailing slash.
+    """
+    full = request.path
+    if not full.startswith(path[i], offset) or (offset and full[offset - 1] != '/'):
+        return '/'.join(path[i:])
+    end = len(full)
+    while end > offset and full[end - 1] == '/':
+        end -= 1
+    return full[offset:end]
+
 class PathArgContainer(dict):
     """
     an object for containing path_args created during traversal.
@@ -61,7 +95,7 @@ def _parse_methods(config):
         # if all upper case, then it is a method
         if k.upper() == k:
             config.pop(k)       # remove from config
-            v = get_function(v) # since it is a method, we need to convert the string to a view object.
+            v = view_resolver.resolve(v) # since it is a method, we need to convert the string to a view object.
             ks = k.split(',')   # split into methods, and add to views dict
             for k in ks:
                 out["views"][k.strip()] = v
@@ -71,26 +105,300 @@ def _parse_methods(config):
 
 
 class PathTree(object):
-    def __init__(self, yaml=None, path=None):
-        if path:
-            with open(path, 'r') as f:
-                yaml = f.read()
-        if yaml is None:
-            raise BaseException("yaml string or path string to yaml file is required")
-        self.conf = YAML.load(yaml)
+    def __init__(self, yaml=None, path=None, cache_alias="default", trace_rate=None, miss_cache_size=1024,
+                 prefetch_workers=0, batch_limit=100, table=None, query_sample_rate=None):
+        # a routetable.RouteTable resolves paths in place of the node tree; nodes are
+        # made as they are resolved, and the tree cannot be changed
+        self.table = table
+        if table is not None:
+            self.conf = None
+            self.root = table.node(0)
+        else:
+            if path:
+                with open(path, 'r') as f:
+                    yaml = f.read()
+            if yaml is None:
+                raise BaseException("yaml string or path string to yaml file is required")
+            self.conf = YAML.load(yaml)
+
+            self.root = PathNode(**self.conf)
+
+        # only build the response cache if at least one node asks for it
+        self.cache_alias = cache_alias
+        self.cache = None
+        if table is not None:
+            if "cache" in table.keys:
+                self.cache = TreeCache(self.cache_alias)
+            if "cache_model" in table.keys:
+                model_cache.watch()
+        else:
+            self._start_cache(self.root)
+
+        # whether any node sends its reads to a database of its own
+        if table is not None:
+            self._read_dbs = "read_db" in table.keys
+        else:
+            self._read_dbs = any("read_db" in n._config for n in self.root.iter_nodes())
+
+        # serializes insert, replace and remove; traversal never takes it
+        self._mutation_lock = threading.Lock()
+
+        # rejects paths that cannot resolve before traversing
+        self.rejection = RejectionFilter(self.root if table is None else table.outline(), miss_cache_size)
+
+        # threads that evaluate independent `prefetch` values concurrently
+        self.pool = ThreadPool(prefetch_workers) if prefetch_workers else None
+
+        # most sub-requests accepted by the batch view
+        self.batch_limit = batch_limit
 
-        self.root = PathNode(**self.conf)
+        # fraction of requests to record a tracing.Trace for
+        if trace_rate is None:
+            trace_rate = getattr(settings, "TRAVERSAL_TRACE_RATE", 0)
+        self.trace_rate = trace_rate
+
+        # fraction of requests to count queries per node for, in budget.query_stats;
+        # requests that reach a query_budget are counted too if budgets are enforced
+        if query_sample_rate is None:
+            query_sample_rate = getattr(settings, "TRAVERSAL_QUERY_SAMPLE_RATE", 0)
+        self.query_sample_rate = query_sample_rate
+
+    def _start_cache(self, node):
+        if self.cache is None and any("cache" in n._config for n in node.iter_nodes()):
+            self.cache = TreeCache(self.cache_alias)
+
+    def insert(self, path, config, index=None):
+        """
+        add a subtree, built from config as if it were in the yaml, as a child of the
+        node at path (e.g. /users/<user|d>). the child is tried at position index
+        among its siblings, or last. a sibling with the same path raises ValueError;
+        use replace to change it.
+
+        like replace and remove, this copies the nodes from the root to the changed
+        node and then swaps in the new root, so traversals already under way carry
+        on with the old tree without taking a lock. `conf` is not updated.
+        """
+        with self._mutation_lock:
+            segments = self._segments(path)
+            root, parent = self._copy_spine(segments)
+            child = PathNode(parent=parent, **config)
+            parent._set_child(child, index=index)
+            self._swap(root, segments + [child.path], added=child)
+        return child
+
+    def replace(self, path, config):
+        """
+        replace the node at path, and its subtree, with a subtree built from config
+        """
+        with self._mutation_lock:
+            segments = self._segments(path)
+            if len(segments) == 1:
+                raise ValueError("the root node cannot be replaced")
+            root, parent = self._copy_spine(segments[:-1])
+            old = parent[segments[-1]]
+            child = PathNode(parent=parent, **config)
+            parent._set_child(child, old=old)
+            self._swap(root, segments, removed=old, added=child)
+        return child
+
+    def remove(self, path):
+        """
+        remove the node at path and its subtree
+        """
+        with self._mutation_lock:
+            segments = self._segments(path)
+            if len(segments) == 1:
+                raise ValueError("the root node cannot be removed")
+            root, parent = self._copy_spine(segments[:-1])
+            old = parent[segments[-1]]
+            parent._remove_child(old)
+            self._swap(root, segments, removed=old)
+
+    def _segments(self, path):
+        return path.rstrip('/').split('/')
+
+    def _copy_spine(self, segments):
+        """
+        copy the nodes along segments, from the root down. return the new root and
+        the copy of the last node.
+        """
+        if self.table is not None:
+            raise ValueError("a tree read from a route table cannot be changed")
+        old = self.root
+        node = root = old._clone(parent=None)
+        for segment in segments[1:]:
+            try:
+                old_child = old[segment]
+            except KeyError:
+                raise KeyError("no node at {}".format('/'.join(segments)))
+            child = old_child._clone(parent=node)
+            node._set_child(child, old=old_child)
+            old, node = old_child, child
+        return root, node
+
+    def _swap(self, root, segments, removed=None, added=None):
+        """
+        make root the live tree, after a subtree change at segments, and bring
+        indexes and caches up to date. the added subtree is indexed before the swap
+        and the removed one after it, so no valid path is ever rejected.
+        """
+        depth = len(segments) - 1
+        if added is not None:
+            self.rejection.add(added, depth)
+            self._start_cache(added)
+            self._read_dbs = self._read_dbs or any("read_db" in n._config for n in added.iter_nodes())
+        self.root = root
+        if removed is not None:
+            self.rejection.remove(removed, depth)
+
+        # requests under the literal part of the changed path may now resolve differently
+        nodes = [root]
+        for segment in segments[1:]:
+            nodes.append(nodes[-1].child_dict.get(segment) or removed)
+        prefix = []
+        for segment, node in zip(segments, nodes):
+            if node.kind != "literal":
+                break
+            prefix.append(segment)
+        self.rejection.forget(prefix)
+        if self.cache:
+            self.cache.invalidate(prefix)
 
     def traverse(self, request, *args, **kwargs):
         """
         traverse the PathTree, then return the result of calling the destination view,
         passing the path_args and models accumulated during traversal
         """
+        if not tracing.should_trace(request, self.trace_rate):
+            return self._traverse(request, *args, **kwargs)
+
+        trace = tracing.Trace(request)
+        response = None
+        try:
+            with trace:
+                response = self._traverse(request, *args, **kwargs)
+        finally:
+            trace.emit(request, response)
+        return response
+
+    def batch(self, request, *args, **kwargs):
+        """
+        a view that runs many requests against the tree in one call. the body is a
+        json list of {"method": ..., "path": ..., "body": ...} entries, "body" being
+        optional json; the response is a json list of {"method", "path", "status",
+        "body"}, in the same order.
+
+        entries run in order, and one that raises gets a 500 without stopping the
+        others. a node that is traversed again with the same path_args
+        keeps the config values it computed for an earlier entry, e.g. parent.qs;
+        entries that are not a GET or HEAD start from fresh values and drop them
+        for the entries after.
+        """
+        try:
+            entries = json.loads(request.body.decode("utf-8"))
+            if not isinstance(entries, list) or not all(_is_entry(e) for e in entries):
+                raise ValueError("expected a list of {method, path, body} entries")
+        except ValueError as e:
+            return HttpResponseBadRequest(six.text_type(e))
+        if len(entries) > self.batch_limit:
+            return HttpResponseBadRequest("at most {} entries are allowed".format(self.batch_limit))
+
+        shared = {}
+        sticky = False
+        out = []
+        for entry in entries:
+            method = entry.get("method", "GET").upper()
+            # writes neither use nor leave behind shared values
+            if method not in conditional.SAFE_METHODS:
+                shared.clear()
+            try:
+                sub_request = _sub_request(request, method, entry["path"], entry.get("body"))
+                sub_request.traversal_batch = shared
+                # reads after a write in the same batch go to the primary
+                sub_request.traversal_primary = sticky
+                response = self.traverse(sub_request, *args, **kwargs)
+            except Http404:
+                response = HttpResponseNotFound()
+            except Exception:
+                request_logger.error("Internal Server Error: %s", entry["path"], exc_info=sys.exc_info(),
+                                     extra={"status_code": 500, "request": request})
+                response = HttpResponseServerError()
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+            if method not in conditional.SAFE_METHODS:
+                shared.clear()
+                sticky = sticky or response.status_code < 400
+
+            body = response.content.decode(response._charset) if response.content else None
+            if body and response.get("Content-Type", "").startswith("application/json"):
+                body = json.loads(body)
+            out.append({"method": method, "path": entry["path"], "status": response.status_code, "body": body})
+        response = HttpResponse(json.dumps(out), content_type="application/json")
+        if sticky and self._routes_reads():
+            routers.stick(response)
+        return response
+
+    def _traverse(self, request, *args, **kwargs):
         path = request.path.rstrip('/').split('/')
-        view, path_args, node = self.root.traverse(request, path, PathArgContainer(), *args, **kwargs)
+        if self.rejection.reject(request.method, path):
+            raise Http404
+        try:
+            view, path_args, node = self._router().traverse(request, path, PathArgContainer(), *args, **kwargs)
+        except Http404:
+            self.rejection.miss(request.method, path)
+            raise
+
+        with routers.reading(routers.read_database(request, node)):
+            if budget.should_account(node, self.query_sample_rate):
+                with budget.Ledger() as ledger:
+                    response = self._respond(request, path, view, path_args, node, *args, **kwargs)
+                ledger.settle()
+            else:
+                response = self._respond(request, path, view, path_args, node, *args, **kwargs)
+        if request.method not in conditional.SAFE_METHODS and response.status_code < 400 and self._routes_reads():
+            routers.stick(response)
+        return response
+
+    def _respond(self, request, path, view, path_args, node, *args, **kwargs):
+        # answer conditional requests from the node's validators, without calling the view
+        validators = (None, None)
+        if request.method in conditional.SAFE_METHODS:
+            validators = conditional.get_validators(node)
+            if conditional.not_modified(request, *validators):
+                return conditional.not_modified_response(*validators)
+
+        cache_key = None
+        if self.cache and request.method == "GET" and "cache" in node._config:
+            response, cache_key = self.cache.lookup(request, node, path)
+            if response is not None:
+                return response
+
+        # evaluate the values the view will need up front, in dependency order
+        if "prefetch" in node._config:
+            names = node.prefetch
+            if names is True:
+                names = sorted(k for k, v in node._config.items() if callable(v))
+            dependencies.prefetch(node, names, self.pool)
+
         kwargs.update(path_args)
         kwargs["node"] = node
-        return view(request, *args, **kwargs)
+        dispatch = lambda: view(request, *args, **kwargs)
+        ledger = budget.current()
+        if ledger is not None:
+            dispatch = functools.partial(ledger.measure, node, dispatch)
+        trace = tracing.current()
+        if trace is not None:
+            dispatch = functools.partial(trace.view, node, dispatch)
+        response = dispatch()
+        if validators != (None, None) and response.status_code == 200:
+            conditional.set_validators(response, *validators)
+
+        if cache_key is not None and response.status_code == 200:
+            self.cache.store(cache_key, response, node.cache)
+        elif self.cache and request.method not in conditional.SAFE_METHODS and response.status_code < 400:
+            # a successful write makes cached ancestors and descendants stale
+            self.cache.invalidate(path)
+        return response
 
     def test_traverse(self, request, *args, **kwargs):
         """
@@ -98,7 +406,52 @@ class PathTree(object):
         return a tuple of the view, accumulated path_args and accumulated models. Useful for unittesting.
         """
         path = request.path.rstrip('/').split('/')
-        return self.root.traverse(request, path, PathArgContainer(), *args, **kwargs)
+        return self._router().traverse(request, path, PathArgContainer(), *args, **kwargs)
+
+    def _routes_reads(self):
+        """
+        True if reads may go to a database other than the primary
+        """
+        return self._read_dbs or bool(routers.replicas())
+
+    def _router(self):
+        return self.root if self.table is None else self.table
+
+def _is_entry(entry):
+    return (isinstance(entry, dict) and isinstance(entry.get("path"), six.string_types)
+            and isinstance(entry.get("method", "GET"), six.string_types))
+
+def _sub_request(request, method, path, body):
+    """
+    build a request for one batch entry, carrying over the batch request's
+    headers, user and session
+    """
+    path, _, query = path.partition('?')
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    environ = dict(request.META)
+    environ.update({
+        "REQUEST_METHOD": str(method),
+        "PATH_INFO": _wsgi_path(path),
+        "QUERY_STRING": str(iri_to_uri(query)),
+        "CONTENT_TYPE": str("application/json"),
+        "CONTENT_LENGTH": str(len(data)),
+        "wsgi.input": io.BytesIO(data),
+    })
+    sub_request = WSGIRequest(environ)
+    for attr in ("user", "session"):
+        if hasattr(request, attr):
+            setattr(sub_request, attr, getattr(request, attr))
+    return sub_request
+
+def _wsgi_path(path):
+    """
+    path, which may hold non-ascii characters and percent escapes, as a server
+    puts it in PATH_INFO: unescaped utf-8 bytes, decoded as latin-1 on python 3
+    """
+    uri = str(iri_to_uri(path))
+    if six.PY3:
+        return unquote(uri, encoding="iso-8859-1")
+    return unquote(uri)
 
 def get_function(path):
     """
@@ -108,10 +461,87 @@ def get_function(path):
     six.exec_('a=' + path, ns)
     return ns['a']
 
+class ViewResolver(object):
+    """
+    resolves view references from config, returning the same callable for
+    identical references.
+
+    references of the form `all_apps.dotted.path` or `all_apps.dotted.path()` are
+    looked up in the appring registry; anything else falls back to get_function.
+    """
+    def __init__(self):
+        self.views = {}
+        self.lookups = 0
+        self.exec_fallbacks = 0
+
+    def resolve(self, reference):
+        self.lookups += 1
+        key = reference.strip()
+        try:
+            return self.views[key]
+        except KeyError:
+            pass
+        match = viewRe.match(key)
+        if match:
+            view = registry.lookup("apps" + match.group(1))
+            if match.group(2):
+                view = view()
+        else:
+            view = get_function(key)
+            self.exec_fallbacks += 1
+        self.views[key] = view
+        return view
+
+    def stats(self):
+        """
+        return counts of references resolved, distinct views created, references
+        that shared an existing view, and references that needed exec
+        """
+        return {
+            "lookups": self.lookups,
+            "unique": len(self.views),
+            "deduplicated": self.lookups - len(self.views),
+            "exec_fallbacks": self.exec_fallbacks,
+        }
+
+view_resolver = ViewResolver()
+
+
+
+class NodeState(object):
+    """
+    the values a PathNode accumulates during traversal. kept apart from the node so
+    that copies of a node made by PathTree's copy-on-write updates share them.
+    """
+    def __init__(self):
+        self.path_args = None
+        self.values = {}
 
 
 class PathNode(object):
     def __init__(self, path="", parent=None, regex=False, name=None, children=[], **config):
+        self._setup(path, parent, regex, name, **config)
+
+        # create children and index, a level at a time rather than recursively, so
+        # that deep trees can be built
+        pending = [(self, children)]
+        while pending:
+            node, configs = pending.pop()
+            node.children = []
+            for child_config in configs:
+                child_config = dict(child_config)
+                grandchildren = child_config.pop("children", [])
+                child = PathNode.__new__(PathNode)
+                child._setup(parent=node, **child_config)
+                node.children.append(child)
+                pending.append((child, grandchildren))
+            node.child_dict = {child.path: child for child in node.children}
+
+    def _setup(self, path="", parent=None, regex=False, name=None, **config):
+        """
+        set up everything about this node except its children
+        """
+        self._state = NodeState()
         self.path = path
         self.parent = parent
         self.regex = regex
@@ -123,32 +553,75 @@ class PathNode(object):
         self.name = name or (self.node_args[0] if len(self.node_args) == 1 else self.path)
 
         # create views
-        self.views = _parse_methods(config)['views']
+        if import_tracer.enabled:
+            with import_tracer.cause(self.route + ":views"):
+                self.views = _parse_methods(config)['views']
+        else:
+            self.views = _parse_methods(config)['views']
 
         # set the config dict that is used by __getattr__
         self._config = {k: self._process_conf_item(v, k in self._force_fns) for k, v in config.items()}
-        self._config_values = {}    # where lazily created values are stored
-
-        # create children and index
-        self.children = [PathNode(parent=self, **child) for child in children]
-        self.child_dict = {child.path: child for child in self.children}
+        if "cache_model" in self._config:
+            model_cache.watch()
 
     # list of all config names that should be forced to be functions, even if they don't have >>>
     _force_fns = ["model", "qs"]
 
     # populated during traversal
-    path_args = None
+    def _get_path_args(self):
+        return self._state.path_args
+    def _set_path_args(self, path_args):
+        self._state.path_args = path_args
+    path_args = property(_get_path_args, _set_path_args)
+
+    # where lazily created values are stored
+    def _get_config_values(self):
+        return self._state.values
+    def _set_config_values(self, values):
+        self._state.values = values
+    _config_values = property(_get_config_values, _set_config_values)
 
     def __getattr__(self, name):
         if name in self._config:
             if name not in self._config_values:
                 out = self._config[name]
                 if hasattr(out, "__call__"):
-                    out = out(all_models, all_apps, self.path_args, self, self.parent)
+                    out = self._evaluate(name, out)
                 self._config_values[name] = out
             return self._config_values[name]
         raise AttributeError("'PathNode' object has no attribute '{}'".format(name))
 
+    def _evaluate(self, name, fn):
+        """
+        call the config function fn, which produces the value of name. each opt-in
+        feature that needs to observe the evaluation wraps call in turn.
+        """
+        # read once: other threads traversing this node overwrite the shared state
+        path_args = self.path_args
+        call = lambda: fn(all_models, all_apps, path_args, self, self.parent)
+
+        if routers.current() is not None:
+            call = functools.partial(routers.route, self, call)
+
+        if name == "model" and "cache_model" in self._config:
+            call = functools.partial(model_cache.fetch, self, name, call, self.cache_model)
+
+        if single_flight.enabled(self, name):
+            call = functools.partial(single_flight.do, single_flight.key(self, name, path_args), call)
+
+        ledger = budget.current()
+        if ledger is not None:
+            call = functools.partial(ledger.measure, self, call)
+
+        trace = tracing.current()
+        if trace is not None:
+            call = functools.partial(trace.config, self, name, call)
+
+        if import_tracer.enabled:
+            with import_tracer.cause(self.route + ":" + name):
+                return call()
+        return call()
+
     def refresh(self, name):
         """
         regenerate a conf value from conf function
@@ -174,6 +647,7 @@ def a(all_models, all_apps, path_args, node, parent):
         if fn:
             ns = {}
             six.exec_(model_fn.format(item), ns)
+            ns['a'].expression = item    # keep the source for tools that inspect config
             return ns['a']
         else:
             return item
@@ -183,27 +657,93 @@ def a(all_models, all_apps, path_args, node, parent):
         determine type of path part and generate the search key and any supporting info
 
         creates the match method that returns a dict of node_args/values if there
-        is a match, or null if there is not.
+        is a match, or null if there is not, and sets kind to one of literal, splat,
+        int, tail or regex.
         """
         match = splatRe.match(self.path)
         if match:
             g = match.groups()
             self.node_args = [g[0]]
             if g[1] == "d":
+                self.kind = "int"
                 self.match = types.MethodType(is_int_match, self)
+            elif g[1] == "*":
+                # matches the rest of the path, see traverse
+                self.kind = "tail"
+                self.match = types.MethodType(is_splat_match, self)
             else:
+                self.kind = "splat"
                 self.match = types.MethodType(is_splat_match, self)
         elif self.regex:
+            self.kind = "regex"
             self.regex = re.compile(self.path)
             self.node_args = self.regex.groupindex.keys()
             self.match = types.MethodType(is_regex_match, self)
         else:
+            self.kind = "literal"
             self.node_args = []
             self.match = types.MethodType(is_string_match, self)
 
     def __getitem__(self, val):
         return self.child_dict[val]
 
+    def _clone(self, parent):
+        """
+        return a shallow copy of this node under parent, with its own list of
+        children. the copy shares config, views and traversal state with this node.
+        """
+        clone = PathNode.__new__(PathNode)
+        clone.__dict__.update(self.__dict__)
+        clone.parent = parent
+        clone.match = types.MethodType(self.match.__func__, clone)
+        clone.children = list(self.children)
+        clone.child_dict = dict(self.child_dict)
+        return clone
+
+    def _set_child(self, child, old=None, index=None):
+        """
+        add child, in place of old if given, otherwise at index or at the end. raises
+        ValueError if another child already has child's path.
+        """
+        existing = self.child_dict.get(child.path)
+        if existing is not None and existing is not old:
+            raise ValueError("{} already has a child at {}; use replace to change it".format(self.route, child.path))
+        if old is not None:
+            index = self.children.index(old)
+            self.children[index] = child
+            del self.child_dict[old.path]
+        elif index is None:
+            self.children.append(child)
+        else:
+            self.children.insert(index, child)
+        self.child_dict[child.path] = child
+
+    def _remove_child(self, child):
+        self.children.remove(child)
+        del self.child_dict[child.path]
+
+    def _get_route(self):
+        """
+        the path patterns from the root to this node, joined with '/', e.g. /users/<user|d>
+        """
+        parts = []
+        node = self
+        while node is not None:
+            parts.append(node.path)
+            node = node.parent
+        return '/'.join(reversed(parts)) or '/'
+    route = property(_get_route)
+
+    def iter_nodes(self):
+        """
+        iterate over this node and all of its descendants, depth first
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
     def __repr__(self):
         return repr({'path': self.path, 'children': [x.path for x in self.children]})
 
@@ -217,42 +757,76 @@ def a(all_models, all_apps, path_args, node, parent):
 
         if the url doesn't resolve, through an http404.
 
-        this method returns a tuple: (view, path_args)
+        this method returns a tuple: (view, path_args, node), or None if this node
+        doesn't match the first path part.
+
+        the path is walked with an index, one level per loop, so neither the depth of
+        the tree nor the length of the path is limited by recursion, and
+        path_remainder is left as it was.
+
+        a tail node, e.g. <rest|*>, is matched against the rest of the path, taken as
+        one slice of request.path, and ends the walk.
+        """
+        batch = getattr(request, "traversal_batch", None)
+        trace = tracing.current()
+
+        node = self
+        candidates = [self]
+        offset = 0      # where path_remainder[i] starts in request.path
+        for i in range(len(path_remainder)):
+            # go through each candidate until we find one that matches; the first
+            # match is final, even if the rest of the path doesn't resolve below it
+            for node in candidates:
+                if node.kind == "tail":
+                    if node._enter(_tail(request, path_remainder, i, offset), path_args, batch, trace):
+                        break
+                elif node._enter(path_remainder[i], path_args, batch, trace):
+                    break
+            else:
+                # if this node doesn't match, return None so the caller can try others
+                if i == 0:
+                    return None
+                raise Http404
+            if node.kind == "tail":
+                break
+            offset += len(path_remainder[i]) + 1
+            candidates = node.children
+
+        # if there is no path left, then try to get the view that corresponds to
+        # the request method and return it and the path_args and node
+        try:
+            return (node.views[request.method], path_args, node)
+        except KeyError:
+            # no matching request method, so we didn't find a match for the url
+            raise Http404
+
+    def _enter(self, path_part, path_args, batch=None, trace=None):
         """
-        # reset all stored config values
-        self._config_values = {}
+        try to match path_part during traversal. return True, having added any
+        node_args to path_args, if it matches.
+        """
+        # reset all stored config values, unless a batch may share them
+        if batch is None:
+            self._config_values = {}
         # set the path_args
         self.path_args = path_args
 
-        path_part = path_remainder[0]
         new_path_args = self.match(path_part)
 
-        # if new_path_args is None, then we don't have a match, so return None
+        if trace is not None:
+            trace.match(self, path_part, new_path_args is not None)
+
+        # if new_path_args is None, then we don't have a match
         if new_path_args is None:
-            return None
+            return False
 
         # create the path_args
         path_args.update(new_path_args)
 
-        # remove the path part that matches this node
-        path_remainder.pop(0)
-
-        if path_remainder:
-            # if there is path left then, go through each child until we find one
-            # that matches, pass its response up the tree
-            for child in self.children:
-                resp = child.traverse(request, path_remainder, path_args)
-                if resp is not None:
-                    return resp
-        else:
-            # if there is no path left, then try to get the view that corresponds to
-            # the request method and return it and the path_args and node back up the tree
-            try:
-                return (self.views[request.method], path_args, self)
-            except:
-                pass
-
-        # if either we have a path_remainder that didn't match any children or we had
-        # no path remainder and we didn't have a matching request method then we didn't find
-        # a match for the url, so return 404.
-        raise Http404
+        # in a batch, keep the values computed for an earlier entry with the same path_args
+        if batch is not None:
+            key = frozenset(path_args.items())
+            if batch.get(self._state) != key:
+                self._config_values = {}
+                batch[self._state] = key
+        return True
@@ -4,12 +4,34 @@
 # rest framework is not required to use traversal,
 # however it is needed to run the example application.
 
+from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
+from .modelcache import model_cache
+
+# transaction.atomic replaces commit_on_success from django 1.6
+atomic = getattr(transaction, "atomic", None) or transaction.commit_on_success
+
+# the error for an item of a list body that is not an object
+NOT_AN_OBJECT = {"non_field_errors": ["Expected an object."]}
+
+# number of rows written per query by the bulk modes; a node can override it
+# with `batch_size` in its config
+BATCH_SIZE = 500
+
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
 class Rest(APIView):
     def get(self, request, node, *args, **kwargs):
+        if hasattr(node, "qs") and hasattr(node, "fields"):
+            return self.list_values(request, node)
         if hasattr(node, "qs"):
             print "in "
             serializer = node.serializer(node.qs, many=True)
@@ -17,8 +39,27 @@ class Rest(APIView):
             serializer = node.serializer(node.model)
         return Response(serializer.data)
 
+    def list_values(self, request, node):
+        """
+        list node.qs as plain rows of the node's `fields`, a list in its config, read
+        with values() rather than through model instances and the serializer. a
+        `fields` query parameter, a comma separated subset of them, narrows the rows.
+        """
+        fields = list(node.fields)
+        requested = request.QUERY_PARAMS.get("fields")
+        if requested:
+            requested = [f.strip() for f in requested.split(",") if f.strip()]
+            unknown = [f for f in requested if f not in fields]
+            if unknown:
+                return Response({"fields": ["Unknown field(s): {}.".format(", ".join(unknown))]},
+                                status=status.HTTP_400_BAD_REQUEST)
+            fields = requested
+        return Response(list(node.qs.values(*fields)))
+
     def post(self, request, node, *args, **kwargs):
         print("NODE post", node.name, node._config)
+        if isinstance(request.DATA, list) and hasattr(node, "qs"):
+            return self.bulk_create(request, node)
         serializer = node.serializer(data=request.DATA)
         if serializer.is_valid():
             serializer.save()
@@ -29,9 +70,184 @@ class Rest(APIView):
 
     def put(self, request, node, *args, **kwargs):
         print("NODE put", node.name, node._config)
+        if hasattr(node, "qs"):
+            if not isinstance(request.DATA, list):
+                return Response({"non_field_errors": ["Expected a list."]}, status=status.HTTP_400_BAD_REQUEST)
+            return self.bulk_update(request, node)
         serializer = node.serializer(node.model, data=request.DATA)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def patch(self, request, node, *args, **kwargs):
+        if hasattr(node, "qs"):
+            return self.update_all(request, node)
+        serializer = node.serializer(node.model, data=request.DATA, partial=True)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data)
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def delete(self, request, node, *args, **kwargs):
+        if hasattr(node, "qs"):
+            return self.delete_all(request, node)
+        node.model.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def bulk_create(self, request, node):
+        """
+        validate every item of a POSTed list, then insert them all with bulk_create.
+        if any item is invalid nothing is written, and the response holds one errors
+        dict per item (empty for valid items).
+
+        bulk_create does not save many-to-many data or send save signals.
+        """
+        if not all(isinstance(item, dict) for item in request.DATA):
+            errors = [{} if isinstance(item, dict) else NOT_AN_OBJECT for item in request.DATA]
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        serializers = [node.serializer(data=item) for item in request.DATA]
+        errors = [{} if s.is_valid() else s.errors for s in serializers]
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        objects = [s.object for s in serializers]
+        try:
+            with atomic():
+                node.qs.model._default_manager.bulk_create(objects, batch_size=getattr(node, "batch_size", BATCH_SIZE))
+        except IntegrityError as e:
+            return Response({"non_field_errors": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"count": len(objects)}, status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, request, node):
+        """
+        update every item of a PUT list in one transaction. items are identified by
+        primary key and must belong to node.qs; they are fetched batch_size at a time.
+        if any item is invalid nothing is written, and the response holds one errors
+        dict per item (empty for valid items).
+        """
+        pk = node.qs.model._meta.pk
+        pk_name = pk.attname
+        items = request.DATA
+        errors = [{} for item in items]
+
+        # primary keys as the database returns them, e.g. "1" as 1
+        keys = [None for item in items]
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors[i] = NOT_AN_OBJECT
+            elif item.get(pk_name) is not None:
+                try:
+                    keys[i] = pk.to_python(item[pk_name])
+                except ValidationError:
+                    pass
+
+        serializers = []
+        for batch in batches(list(enumerate(items)), getattr(node, "batch_size", BATCH_SIZE)):
+            instances = node.qs.in_bulk([keys[i] for i, item in batch if keys[i] is not None])
+            for i, item in batch:
+                if errors[i]:
+                    continue
+                instance = instances.get(keys[i]) if keys[i] is not None else None
+                if instance is None:
+                    errors[i] = {pk_name: ["Not found."]}
+                    continue
+                serializer = node.serializer(instance, data=item)
+                if serializer.is_valid():
+                    serializers.append(serializer)
+                else:
+                    errors[i] = serializer.errors
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with atomic():
+                for serializer in serializers:
+                    serializer.save()
+        except IntegrityError as e:
+            return Response({"non_field_errors": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"count": len(serializers)})
+
+    def update_all(self, request, node):
+        """
+        set the fields of a PATCHed dict on every object in node.qs, or on the first
+        `limit` of them, with a single UPDATE. each field must be a writable field of
+        the node's serializer, not many-to-many, and is validated by it; there is no
+        one object for model validation to check.
+
+        like QuerySet.update, this does not call save or send save signals. while the
+        model cache is watching, the primary keys are read first so the cached
+        objects can be invalidated.
+        """
+        if not isinstance(request.DATA, dict) or not request.DATA:
+            return Response({"non_field_errors": ["Expected an object of fields to update."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = node.serializer(data=request.DATA, partial=True)
+        many_to_many = set(f.name for f in node.qs.model._meta.many_to_many)
+        errors = {}
+        for name in request.DATA:
+            field = serializer.fields.get(name)
+            if field is None or field.read_only or (field.source or name) in many_to_many:
+                errors[name] = ["Cannot be updated in bulk."]
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # the field by field half of serializer.is_valid
+        serializer._errors = {}
+        values = serializer.restore_fields(request.DATA, None)
+        if values is not None:
+            values = serializer.perform_validation(values)
+        if serializer._errors:
+            return Response(serializer._errors, status=status.HTTP_400_BAD_REQUEST)
+
+        qs, error = self.limited(request, node.qs)
+        if error is not None:
+            return error
+        pks = ()
+        if model_cache.watching:
+            pks = list(qs.values_list("pk", flat=True))
+            qs = qs.model._default_manager.filter(pk__in=pks)
+        try:
+            with atomic():
+                count = qs.update(**values)
+        except IntegrityError as e:
+            return Response({"non_field_errors": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        for pk in pks:
+            model_cache.invalidate(qs.model, pk)
+        return Response({"count": count})
+
+    def delete_all(self, request, node):
+        """
+        delete every object in node.qs, or the first `limit` of them. objects without
+        dependent rows or delete signals go in a single DELETE; the rest are collected
+        by django, as QuerySet.delete does.
+        """
+        qs, error = self.limited(request, node.qs)
+        if error is not None:
+            return error
+        with atomic():
+            count = qs.count()
+            qs.delete()
+        return Response({"count": count})
+
+    def limited(self, request, qs):
+        """
+        return qs, narrowed to its first `limit` rows if the request asks for a limit,
+        and an error response or None. update and delete cannot take a sliced
+        queryset, and not every database allows LIMIT in a subquery, so the primary
+        keys of a limited or sliced queryset are read first.
+        """
+        limit = request.QUERY_PARAMS.get("limit")
+        if limit is not None:
+            try:
+                limit = int(limit)
+                if limit < 1:
+                    raise ValueError
+            except ValueError:
+                return None, Response({"limit": ["Expected a positive integer."]}, status=status.HTTP_400_BAD_REQUEST)
+        if limit is None and qs.query.can_filter():
+            return qs, None
+        pks = list(qs.values_list("pk", flat=True)[:limit])
+        return qs.model._default_manager.filter(pk__in=pks), None
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+End to end load test for the yamlusers example project.
+
+Seeds the local sqlite database with users and groups, then drives a mixed
+GET/POST/PUT workload through the project's WSGI application, in process, from
+several worker processes at once. Reports throughput and p50/p95/p99 latency
+per route. No server or other external service is needed:
+
+    python loadtest.py --users 1000 --groups 50 --requests 5000 --workers 4
+
+Workers are processes, not threads, mirroring a pre-fork server such as gunicorn.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from optparse import OptionParser
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)))    # urls.py loads urls.yaml relative to here
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yamlusers.settings")
+
+
+def seed(users, groups):
+    """
+    create the tables if needed, and top up the loadtest users and groups to the
+    requested counts. every user is added to one group.
+    """
+    from django.contrib.auth.models import User, Group
+    from django.core.management import call_command
+    call_command("syncdb", interactive=False, verbosity=0)
+
+    existing = Group.objects.filter(name__startswith="load").count()
+    Group.objects.bulk_create([Group(name="load{}".format(i)) for i in range(existing, groups)])
+    existing = User.objects.filter(username__startswith="load").count()
+    User.objects.bulk_create([User(username="load{}".format(i)) for i in range(existing, users)])
+
+    group_ids = list(Group.objects.filter(name__startswith="load").values_list("id", flat=True))
+    through = User.groups.through
+    members = set(through.objects.values_list("user_id", flat=True))
+    through.objects.bulk_create([
+        through(user_id=user_id, group_id=random.choice(group_ids))
+        for user_id in User.objects.filter(username__startswith="load").values_list("id", flat=True)
+        if user_id not in members])
+
+
+def workload(count, mix):
+    """
+    return count (route, method, path, body) tuples. mix maps a method to its
+    relative weight.
+    """
+    from django.contrib.auth.models import User, Group
+    user_ids = list(User.objects.filter(username__startswith="load").values_list("id", flat=True))
+    group_ids = list(Group.objects.filter(name__startswith="load").values_list("id", flat=True))
+    gets = [
+        lambda: ("/users", "/users", None),
+        lambda: ("/users/<user>", "/users/{}".format(random.choice(user_ids)), None),
+        lambda: ("/users/<user>/groups", "/users/{}/groups".format(random.choice(user_ids)), None),
+        lambda: ("/groups", "/groups", None),
+        lambda: ("/groups/<group>", "/groups/{}".format(random.choice(group_ids)), None),
+    ]
+    methods = [m for m, weight in sorted(mix.items()) for i in range(weight)]
+
+    out = []
+    for i in range(count):
+        method = random.choice(methods)
+        if method == "GET":
+            route, path, body = random.choice(gets)()
+        elif method == "POST":
+            route, path, body = "/users", "/users", {"username": "post{}_{}".format(os.getpid(), i)}
+        else:
+            user_id = random.choice(user_ids)
+            route, path = "/users/<user>", "/users/{}".format(user_id)
+            body = {"username": "load_put{}".format(user_id), "first_name": "put{}".format(i)}
+        out.append((method + " " + route, method, path, body))
+    return out
+
+
+def environ(method, path, body):
+    body = json.dumps(body).encode("utf-8") if body is not None else b""
+    return {
+        "REQUEST_METHOD": str(method),
+        "PATH_INFO": str(path),
+        "SCRIPT_NAME": str(""),
+        "QUERY_STRING": str(""),
+        "CONTENT_TYPE": str("application/json"),
+        "CONTENT_LENGTH": str(len(body)),
+        "HTTP_HOST": str("localhost"),
+        "SERVER_NAME": str("localhost"),
+        "SERVER_PORT": str("80"),
+        "SERVER_PROTOCOL": str("HTTP/1.1"),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": str("http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+
+def run(requests):
+    """
+    worker: send each request through the WSGI application, and return a list of
+    (route, seconds, status) tuples
+    """
+    from django.db import connection
+    from yamlusers.wsgi import application
+    connection.close()                      # never share the parent's connection
+    sys.stdout = open(os.devnull, "w")      # the example views print as they go
+
+    statuses = []
+    start_response = lambda status, headers, exc_info=None: statuses.append(int(status.split()[0]))
+    out = []
+    for route, method, path, body in requests:
+        start = time.time()
+        response = application(environ(method, path, body), start_response)
+        try:
+            for chunk in response:
+                pass
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+        out.append((route, time.time() - start, statuses.pop()))
+    return out
+
+
+def percentile(ordered, p):
+    """
+    the nearest-rank p percentile of the sorted list ordered
+    """
+    rank = int(math.ceil(p * len(ordered) / 100))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def report(results, seconds):
+    routes = {}
+    for route, latency, status in results:
+        routes.setdefault(route, []).append((latency, status))
+
+    print("{} requests in {:.2f}s: {:.1f} requests/s".format(len(results), seconds, len(results) / seconds))
+    print("{:<30} {:>7} {:>7} {:>9} {:>9} {:>9}".format("route", "count", "errors", "p50 ms", "p95 ms", "p99 ms"))
+    for route, samples in sorted(routes.items()):
+        latencies = sorted(s[0] * 1000 for s in samples)
+        errors = len([s for s in samples if s[1] >= 400])
+        print("{:<30} {:>7} {:>7} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+            route, len(samples), errors,
+            percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
+
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--users", type="int", default=1000, help="users to seed [%default]")
+    parser.add_option("--groups", type="int", default=50, help="groups to seed [%default]")
+    parser.add_option("--requests", type="int", default=2000, help="total requests to send [%default]")
+    parser.add_option("--workers", type="int", default=4, help="concurrent worker processes [%default]")
+    parser.add_option("--mix", default="GET=8,POST=1,PUT=1", help="relative weight of each method [%default]")
+    parser.add_option("--seed", type="int", default=0, help="random seed [%default]")
+    options, args = parser.parse_args()
+
+    random.seed(options.seed)
+    mix = dict((m.strip().upper(), int(w)) for m, w in (part.split("=") for part in options.mix.split(",")))
+
+    seed(options.users, options.groups)
+    requests = workload(options.requests, mix)
+    chunks = [requests[i::options.workers] for i in range(options.workers)]
+
+    from django.db import connection
+    connection.close()
+    pool = multiprocessing.Pool(options.workers)
+    start = time.time()
+    results = pool.map(run, chunks)
+    seconds = time.time() - start
+    pool.close()
+    pool.join()
+
+    report([r for chunk in results for r in chunk], seconds)
+
+
+if __name__ == "__main__":
+    main()
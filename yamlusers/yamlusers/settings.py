@@ -17,6 +17,12 @@ DATABASES = {
         'PASSWORD': '',                  # Not used with sqlite3.
         'HOST': '',                      # Set to empty string for localhost. Not used with sqlite3.
         'PORT': '',                      # Set to empty string for default. Not used with sqlite3.
+    },
+    # a stand-in read replica. reads only go to it if TRAVERSAL_READ_DATABASES
+    # lists it, or a node's read_db names it.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': './yamluser_replica.sqlite',
     }
 }
 
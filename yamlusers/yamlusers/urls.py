@@ -8,6 +8,7 @@ from traversal import PathTree
 pathtree = PathTree(path="./yamlusers/urls.yaml")
 
 urlpatterns = patterns('',
+	url(r'^batch$', pathtree.batch),
 	url(r'.*', pathtree.traverse)
     # Examples:
     # url(r'^$', 'yamlusers.views.home', name='home'),